@@ -0,0 +1,119 @@
+# benchmarks/fake_ssdp.py
+"""Loopback stand-in for a Samsung TV answering SSDP and mDNS discovery.
+
+Replies to M-SEARCH requests the way a TV's DIAL/remote-control service
+does, and to mDNS queries for the _samsungmsf service, from its own
+address. Pointing PassiveDiscovery at it instead of the multicast groups
+exercises the passive path without a real network:
+
+    python benchmarks/fake_ssdp.py --host 127.79.1.2
+
+starts an emulated TV and a responder on that address, runs one round of
+passive discovery against them and exits with status 1 unless the TV is
+found.
+"""
+import argparse
+import asyncio
+import os
+import struct
+import sys
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from fake_tv import EmulatorFarm  # noqa: E402
+
+DISCOVERY_PORT = 1900
+
+
+class FakeDiscoveryResponder(asyncio.DatagramProtocol):
+    """Answers SSDP M-SEARCH and mDNS queries sent to host:port"""
+
+    def __init__(self, host="127.0.0.1", port=DISCOVERY_PORT, tv_port=8001):
+        self.host = host
+        self.port = port
+        self.tv_port = tv_port
+        self.queries = 0
+        self._transport = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: self, local_addr=(self.host, self.port)
+        )
+        return self
+
+    def close(self):
+        if self._transport:
+            self._transport.close()
+            self._transport = None
+
+    def ssdp_reply(self, search_target):
+        return (
+            "HTTP/1.1 200 OK\r\n"
+            "CACHE-CONTROL: max-age=1800\r\n"
+            "EXT:\r\n"
+            f"LOCATION: http://{self.host}:{self.tv_port}/api/v2/\r\n"
+            "SERVER: SHP, UPnP/1.0, Samsung UPnP SDK/1.0\r\n"
+            f"ST: {search_target}\r\n"
+            "\r\n"
+        ).encode()
+
+    @staticmethod
+    def mdns_reply(query):
+        # Echo the question back with the response bit set; enough for the
+        # controller, which only looks for a reply naming the service
+        _, _, questions = struct.unpack("!HHH", query[:6])
+        return struct.pack("!HHHHHH", 0, 0x8400, questions, 0, 0, 0) + query[12:]
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        if data.startswith(b"M-SEARCH"):
+            target = ""
+            for line in data.decode(errors="replace").split("\r\n"):
+                name, _, value = line.partition(":")
+                if name.strip().upper() == "ST":
+                    target = value.strip()
+            self._transport.sendto(self.ssdp_reply(target), addr)
+        elif len(data) >= 12 and not struct.unpack("!H", data[2:4])[0] & 0x8000:
+            self._transport.sendto(self.mdns_reply(data), addr)
+
+
+def check(host, port=DISCOVERY_PORT, tv_port=8001):
+    """Run passive discovery against a loopback TV; return (TVs, seconds)"""
+    import samsung_tv_controller as controller
+
+    farm = EmulatorFarm()
+    try:
+        farm.add(host, port=tv_port)
+        responder = farm.run(FakeDiscoveryResponder(host, port, tv_port).start())
+        address = (host, port)
+        discovery = controller.PassiveDiscovery(ssdp_address=address, mdns_address=address)
+        started = time.perf_counter()
+        found = controller.get_event_loop_thread().run(discovery.discover(), 30)
+        elapsed = time.perf_counter() - started
+        farm.loop.call_soon_threadsafe(responder.close)
+        controller.get_event_loop_thread().run(controller.get_session_pool().close_all(), 10)
+    finally:
+        farm.close()
+    return found, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.79.1.2")
+    parser.add_argument("--port", type=int, default=DISCOVERY_PORT)
+    parser.add_argument("--tv-port", type=int, default=8001)
+    args = parser.parse_args()
+
+    found, elapsed = check(args.host, args.port, args.tv_port)
+    print(f"passive discovery: {len(found)} TVs in {elapsed:.2f}s")
+    for tv in found:
+        print(f"  {tv['ip']} ({tv['name']})")
+    sys.exit(0 if any(tv["ip"] == args.host for tv in found) else 1)
+
+
+if __name__ == "__main__":
+    main()
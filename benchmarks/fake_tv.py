@@ -0,0 +1,282 @@
+# benchmarks/fake_tv.py
+"""Local emulator of a Samsung TV's remote-control API.
+
+Serves the REST device-info endpoint (GET /api/v2/) and the
+samsung.remote.control WebSocket channel on one plain-HTTP port, answers
+app-list, app-launch and app-icon requests, and records every key it
+receives, decoding text sent through the input method. Latency, jitter and dropped connections are configurable so the
+controller can be exercised without a real TV:
+
+    python benchmarks/fake_tv.py --host 127.0.0.2 --latency 0.02 --jitter 0.01
+
+Only the unencrypted port (8001 on a real TV) is emulated; point the
+controller at it by setting samsung_tv_controller.TV_PORT.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+import uuid
+
+from websockets.asyncio.server import serve
+from websockets.datastructures import Headers
+from websockets.http11 import Response
+
+DEFAULT_APPS = (
+    {"appId": "11101200001", "name": "Netflix", "app_type": 2},
+    {"appId": "111299001912", "name": "YouTube", "app_type": 2},
+    {"appId": "3201606009684", "name": "Prime Video", "app_type": 2},
+    {"appId": "3201901017640", "name": "Disney+", "app_type": 2},
+)
+# Smallest valid PNG, returned for every icon request
+ICON_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+
+class FakeSamsungTV:
+    """One emulated TV listening on host:port"""
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=8001,
+        name="Samsung Emulator",
+        mac=None,
+        latency=0.0,
+        jitter=0.0,
+        drop_rate=0.0,
+        approval_delay=0.0,
+        apps=DEFAULT_APPS,
+    ):
+        self.host = host
+        self.port = port
+        self.name = name
+        suffix = uuid.uuid5(uuid.NAMESPACE_DNS, f"{host}:{port}").hex[:6]
+        self.mac = mac or "8c:79:f5:" + ":".join(suffix[i : i + 2] for i in (0, 2, 4))
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.approval_delay = approval_delay
+        self.power_state = "on"
+        self.apps = [dict(app, icon=f"/opt/share/webappservice/{app['appId']}.png") for app in apps]
+        self.token = str(random.randrange(10**7, 10**8))
+        self.keys = []
+        self.launched = []
+        self.typed = []
+        self._channels = set()
+        self.connections = 0
+        self.dropped = 0
+        self._key_waiters = []
+        self._server = None
+
+    def delay(self):
+        """One simulated network delay in seconds"""
+        return max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+
+    def device_info(self):
+        return {
+            "id": f"uuid:{uuid.uuid5(uuid.NAMESPACE_OID, self.mac)}",
+            "name": self.name,
+            "type": "Samsung SmartTV",
+            "uri": f"http://{self.host}:{self.port}/api/v2/",
+            "remote": "1.0",
+            "version": "2.0.25",
+            "isSupport": json.dumps({"remote": "true", "remote_four_directions": "true"}),
+            "device": {
+                "name": self.name,
+                "modelName": "QE55EMU",
+                "PowerState": self.power_state,
+                "TokenAuthSupport": "true",
+                "networkType": "wireless",
+                "wifiMac": self.mac,
+                "ip": self.host,
+                "duid": f"uuid:{uuid.uuid5(uuid.NAMESPACE_DNS, self.mac)}",
+            },
+        }
+
+    async def start(self):
+        self._server = await serve(
+            self._handle_channel,
+            self.host,
+            self.port,
+            process_request=self._handle_http,
+        )
+        return self
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def wait_for_keys(self, count, timeout=10):
+        """Wait until at least count keys have been received"""
+        if len(self.keys) >= count:
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._key_waiters.append((count, waiter))
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        finally:
+            if (count, waiter) in self._key_waiters:
+                self._key_waiters.remove((count, waiter))
+
+    async def focus_text_field(self, focused=True):
+        """Announce a text field gaining or losing focus, as the TV's input method does"""
+        event = "ms.remote.imeStart" if focused else "ms.remote.imeEnd"
+        for ws in list(self._channels):
+            await ws.send(json.dumps({"event": event, "data": ""}))
+
+    async def _handle_http(self, connection, request):
+        if request.path.startswith("/api/v2/channels/"):
+            return None
+        await asyncio.sleep(self.delay())
+        if request.path.rstrip("/") != "/api/v2":
+            return connection.respond(404, "Not Found\n")
+        body = json.dumps(self.device_info()).encode()
+        headers = Headers(
+            [("Content-Type", "application/json"), ("Content-Length", str(len(body)))]
+        )
+        return Response(200, "OK", headers, body)
+
+    async def _handle_channel(self, ws):
+        self.connections += 1
+        query = ws.request.path.partition("?")[2]
+        params = dict(part.partition("=")[::2] for part in query.split("&") if part)
+        if params.get("token") != self.token:
+            # Stands in for the user accepting the prompt on the TV
+            await asyncio.sleep(self.approval_delay)
+        await asyncio.sleep(self.delay())
+        await ws.send(
+            json.dumps(
+                {
+                    "event": "ms.channel.connect",
+                    "data": {"id": str(uuid.uuid4()), "clients": [], "token": self.token},
+                }
+            )
+        )
+        # Messages are stamped on arrival and handled in order once their
+        # own network delay has passed, so a burst is delayed but not
+        # serialised behind each other's delays
+        inbox = asyncio.Queue()
+        worker = asyncio.create_task(self._deliver(ws, inbox))
+        deliver_at = 0.0
+        self._channels.add(ws)
+        try:
+            async for raw in ws:
+                if self.drop_rate and random.random() < self.drop_rate:
+                    self.dropped += 1
+                    ws.transport.abort()
+                    return
+                deliver_at = max(deliver_at, time.monotonic() + self.delay())
+                inbox.put_nowait((deliver_at, raw))
+        finally:
+            self._channels.discard(ws)
+            worker.cancel()
+
+    async def _deliver(self, ws, inbox):
+        while True:
+            deliver_at, raw = await inbox.get()
+            await asyncio.sleep(max(0.0, deliver_at - time.monotonic()))
+            try:
+                message = json.loads(raw)
+            except ValueError:
+                continue
+            reply = self._handle_message(message)
+            if reply is not None:
+                await ws.send(json.dumps(reply))
+
+    def _handle_message(self, message):
+        method = message.get("method")
+        params = message.get("params", {})
+        if method == "ms.remote.control":
+            self.keys.append((time.perf_counter(), params.get("DataOfCmd"), params.get("Cmd")))
+            if params.get("TypeOfRemote") == "SendInputString":
+                self.typed.append(base64.b64decode(params.get("Cmd", "")).decode())
+            for count, waiter in list(self._key_waiters):
+                if len(self.keys) >= count and not waiter.done():
+                    waiter.set_result(None)
+                    self._key_waiters.remove((count, waiter))
+            return None
+        if method != "ms.channel.emit":
+            return None
+        event = params.get("event")
+        data = params.get("data") or {}
+        if event == "ed.installedApp.get":
+            return {"event": event, "from": "host", "data": {"data": self.apps}}
+        if event == "ed.apps.launch":
+            self.launched.append(data.get("appId"))
+            known = any(app["appId"] == data.get("appId") for app in self.apps)
+            return {"event": event, "from": "host", "data": 200 if known else 404}
+        if event == "ed.apps.icon":
+            return {
+                "event": event,
+                "from": "host",
+                "data": {
+                    "iconPath": data.get("iconPath"),
+                    "imageBase64": base64.b64encode(ICON_PNG).decode(),
+                },
+            }
+        return None
+
+
+class EmulatorFarm:
+    """Runs several emulated TVs on a private event loop thread"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.tvs = []
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def run(self, coro, timeout=None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def add(self, host, **options):
+        tv = self.run(FakeSamsungTV(host, **options).start())
+        self.tvs.append(tv)
+        return tv
+
+    def close(self):
+        for tv in self.tvs:
+            self.run(tv.close())
+        self.tvs = []
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--name", default="Samsung Emulator")
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--approval-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    async def serve_forever():
+        tv = FakeSamsungTV(
+            args.host,
+            args.port,
+            name=args.name,
+            latency=args.latency,
+            jitter=args.jitter,
+            drop_rate=args.drop_rate,
+            approval_delay=args.approval_delay,
+        )
+        await tv.start()
+        print(f"Emulating {tv.name} on http://{tv.host}:{tv.port}/api/v2/")
+        await asyncio.Future()
+
+    try:
+        asyncio.run(serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# benchmarks/load_test.py
+"""Measure /api/key latency while an /api/scan is running.
+
+Starts the web server in-process with its config and caches in a
+temporary directory, connects it to a TV from fake_tv.py, kicks off a full
+network scan from one client and hammers /api/key from several others,
+then prints p50/p99 key latency. The TV's key rate limit and autorepeat
+merging are lifted so every request goes out to the TV. Run it once per
+server mode to compare:
+
+    python benchmarks/load_test.py --server pooled
+    python benchmarks/load_test.py --server single
+"""
+import argparse
+import concurrent.futures
+import os
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from http.server import HTTPServer
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import samsung_tv_controller as controller  # noqa: E402
+from fake_tv import EmulatorFarm  # noqa: E402
+
+TV_HOST = "127.78.1.2"
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def post_key(base_url, key="KEY_VOLUP"):
+    request = urllib.request.Request(
+        f"{base_url}/api/key",
+        data=json.dumps({"key": key}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=60) as response:
+        result = json.loads(response.read())
+    if not result["success"]:
+        raise RuntimeError(result["message"])
+    return time.perf_counter() - started
+
+
+def connect_tv(remote, tv_port):
+    """Connect the server to an emulated TV and let it take keys at any rate"""
+    farm = EmulatorFarm()
+    farm.add(TV_HOST, port=tv_port)
+    job = remote.start_connect(TV_HOST, wait=True)
+    if job["status"] != "ready":
+        farm.close()
+        raise RuntimeError(job["message"])
+    remote.tv.rate_limiter = controller.TokenBucket(rate=10**6, capacity=10**6)
+    remote.tv.keys.threshold = float("inf")
+    return farm
+
+
+def run(server_mode, scan_range, clients, keys_per_client, tv_port):
+    workdir = tempfile.mkdtemp(prefix="tv-load-")
+    os.chdir(workdir)
+    controller._token_store = controller.TokenStore(
+        os.path.join(workdir, "tv-tokens.json"), os.path.join(workdir, "tv-token.txt")
+    )
+    controller.TV_PORT = tv_port
+    remote = controller.RemoteHandler.remote
+    remote.get_network_ranges = lambda: [scan_range]
+    farm = connect_tv(remote, tv_port)
+    if server_mode == "single":
+        server = HTTPServer(("127.0.0.1", 0), controller.RemoteHandler)
+    else:
+        server = controller.PooledHTTPServer(("127.0.0.1", 0), controller.RemoteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    scan_started = time.perf_counter()
+    scan = threading.Thread(
+        target=lambda: urllib.request.urlopen(
+            f"{base_url}/api/scan?refresh=1", timeout=120
+        ).read()
+    )
+    scan.start()
+    time.sleep(0.05)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=clients) as pool:
+        latencies = list(
+            pool.map(lambda _: post_key(base_url), range(clients * keys_per_client))
+        )
+    scan.join()
+    scan_elapsed = time.perf_counter() - scan_started
+
+    server.shutdown()
+    server.server_close()
+    controller.get_event_loop_thread().run(controller.get_session_pool().close_all(), 10)
+    farm.close()
+
+    print(f"server mode:     {server_mode}")
+    print(f"scan range:      {scan_range} ({scan_elapsed:.2f}s)")
+    print(f"key requests:    {len(latencies)} from {clients} clients")
+    print(f"key p50:         {statistics.median(latencies) * 1000:.1f} ms")
+    print(f"key p99:         {percentile(latencies, 99) * 1000:.1f} ms")
+    print(f"key max:         {max(latencies) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=("pooled", "single"), default="pooled")
+    parser.add_argument("--scan-range", default="10.255.252.0/22")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--keys-per-client", type=int, default=25)
+    parser.add_argument("--tv-port", type=int, default=8001)
+    args = parser.parse_args()
+    run(args.server, args.scan_range, args.clients, args.keys_per_client, args.tv_port)
+
+
+if __name__ == "__main__":
+    main()
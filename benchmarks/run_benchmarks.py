@@ -0,0 +1,356 @@
+# benchmarks/run_benchmarks.py
+"""Benchmark the controller end to end against emulated TVs.
+
+Starts the web server in-process with its config, caches and tokens in a
+temporary directory, points it at TVs from fake_tv.py and reports:
+
+- key-press latency (HTTP request to key arriving at the TV), p50/p99
+- macro throughput through /api/keys, in keys per second
+- typing a search query through /api/text, against the keys the on-screen
+  keyboard would need
+- scan duration for each subnet size, and for a scan answered from the
+  neighbor table
+- server request throughput on /api/status
+- cold start time, from startup.py
+
+Results are printed and saved as JSON so runs can be compared across
+versions:
+
+    python benchmarks/run_benchmarks.py --latency 0.005 --jitter 0.002
+    python benchmarks/run_benchmarks.py --output results.json
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tomllib
+import urllib.request
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import startup  # noqa: E402
+from fake_tv import EmulatorFarm  # noqa: E402
+
+# Emulated TVs live on loopback addresses so scans have real hosts to sweep
+SCAN_BASE = "127.77.0.0"
+SCAN_TV_HOSTS = ("127.77.0.2", "127.77.0.7", "127.77.0.12")
+SCAN_PREFIXES = (28, 26, 24, 22)
+KEY_TV_HOST = "127.78.0.2"
+# A key not received within this time counts as lost
+KEY_LOSS_TIMEOUT = 2
+TEXT_QUERY = "stranger things s4e1"
+
+
+def percentile(samples, pct):
+    """Return the pct-th percentile of a list of samples"""
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+    }
+
+
+def post(base_url, path, data):
+    request = urllib.request.Request(
+        f"{base_url}{path}",
+        data=json.dumps(data).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return json.loads(response.read())
+
+
+def wait_for_keys(farm, tv, count):
+    """Wait for the TV to receive count keys; False if some never arrive"""
+    try:
+        farm.run(tv.wait_for_keys(count, KEY_LOSS_TIMEOUT))
+        return True
+    except TimeoutError:
+        return False
+
+
+def bench_key_latency(base_url, farm, tv, presses, interval):
+    latencies = []
+    for _ in range(presses):
+        # Paced like taps, so presses are not merged or rate limited
+        time.sleep(interval)
+        received = len(tv.keys)
+        started = time.perf_counter()
+        post(base_url, "/api/key", {"key": "KEY_VOLUP"})
+        if wait_for_keys(farm, tv, received + 1):
+            latencies.append(tv.keys[received][0] - started)
+    return dict(summarize(latencies), lost=presses - len(latencies))
+
+
+def bench_macro_throughput(base_url, farm, tv, macro_keys, rounds):
+    rates = []
+    lost = 0
+    for _ in range(rounds):
+        received = len(tv.keys)
+        started = time.perf_counter()
+        result = post(
+            base_url, "/api/keys", {"keys": [{"key": "KEY_RIGHT", "repeat": macro_keys}], "interval": 0}
+        )
+        if not result["success"] and not tv.drop_rate:
+            raise RuntimeError(result["message"])
+        wait_for_keys(farm, tv, received + macro_keys)
+        delivered = len(tv.keys) - received
+        lost += macro_keys - delivered
+        if delivered:
+            rates.append(delivered / (tv.keys[-1][0] - started))
+    return {
+        "keys_per_macro": macro_keys,
+        "rounds": rounds,
+        "keys_per_second": round(statistics.median(rates), 1),
+        "lost": lost,
+    }
+
+
+def bench_text(base_url, controller, remote, farm, tv, query):
+    farm.run(tv.focus_text_field())
+    deadline = time.perf_counter() + KEY_LOSS_TIMEOUT
+    while not remote.tv.ime_active and time.perf_counter() < deadline:
+        time.sleep(0.001)
+    received = len(tv.keys)
+    started = time.perf_counter()
+    result = post(base_url, "/api/text", {"text": query})
+    if not result["success"]:
+        raise RuntimeError(result["message"])
+    wait_for_keys(farm, tv, received + 1)
+    elapsed = tv.keys[received][0] - started
+    farm.run(tv.focus_text_field(False))
+    return {
+        "chars": len(query),
+        "method": result["method"],
+        "typed_ms": round(elapsed * 1000, 3),
+        "keyboard_keys": len(controller.plan_keyboard_path(query)),
+    }
+
+
+def bench_scan(remote, prefixes):
+    results = []
+    for prefix in prefixes:
+        network = f"{SCAN_BASE}/{prefix}"
+        started = time.perf_counter()
+        found = remote.scan_network(network, refresh=True)
+        elapsed = time.perf_counter() - started
+        results.append(
+            {
+                "network": network,
+                "hosts": 2 ** (32 - prefix) - 2,
+                "tvs_found": len(found),
+                "seconds": round(elapsed, 3),
+            }
+        )
+    return results
+
+
+def bench_neighbor_scan(controller, remote, farm, workdir, prefix):
+    """Time a cold-cache scan when the TVs are already in the neighbor table"""
+    neighbors = {tv.host: tv.mac for tv in farm.tvs if tv.host in SCAN_TV_HOSTS}
+    # Other live hosts that are not TVs
+    neighbors.update({f"127.77.0.{i}": f"02:00:00:00:00:{i:02x}" for i in range(20, 30)})
+    read_neighbor_table = controller.read_neighbor_table
+    controller.read_neighbor_table = lambda: neighbors
+    remote.discovery_cache = controller.DiscoveryCache(os.path.join(workdir, "neighbors.json"))
+    network = f"{SCAN_BASE}/{prefix}"
+    try:
+        started = time.perf_counter()
+        found = remote.scan_network(network)
+        elapsed = time.perf_counter() - started
+    finally:
+        controller.read_neighbor_table = read_neighbor_table
+    return {
+        "network": network,
+        "neighbors": len(neighbors),
+        "tvs_found": len(found),
+        "seconds": round(elapsed, 3),
+    }
+
+
+def bench_throughput(base_url, clients, duration):
+    deadline = time.perf_counter() + duration
+
+    def client():
+        count = 0
+        while time.perf_counter() < deadline:
+            with urllib.request.urlopen(f"{base_url}/api/status", timeout=10) as response:
+                response.read()
+            count += 1
+        return count
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=clients) as pool:
+        total = sum(pool.map(lambda _: client(), range(clients)))
+    elapsed = time.perf_counter() - started
+    return {
+        "endpoint": "/api/status",
+        "clients": clients,
+        "requests": total,
+        "requests_per_second": round(total / elapsed, 1),
+    }
+
+
+def version_info():
+    with open(os.path.join(REPO_DIR, "pyproject.toml"), "rb") as f:
+        version = tomllib.load(f)["project"]["version"]
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return version, commit
+
+
+def run(args):
+    # Measured first, in fresh processes, before this one warms any caches
+    startup_result = startup.run(args.startup_runs)
+    workdir = tempfile.mkdtemp(prefix="tv-bench-")
+    os.chdir(workdir)
+    import samsung_tv_controller as controller
+
+    controller._token_store = controller.TokenStore(
+        os.path.join(workdir, "tv-tokens.json"), os.path.join(workdir, "tv-token.txt")
+    )
+    controller.TV_PORT = args.tv_port
+    remote = controller.RemoteHandler.remote
+    remote.discovery_mode = "active"
+
+    options = {
+        "port": args.tv_port,
+        "latency": args.latency,
+        "jitter": args.jitter,
+        "drop_rate": args.drop_rate,
+    }
+    farm = EmulatorFarm()
+    key_tv = farm.add(KEY_TV_HOST, **options)
+    for host in SCAN_TV_HOSTS:
+        farm.add(host, **options)
+
+    server = controller.PooledHTTPServer(("127.0.0.1", 0), controller.RemoteHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        connected = post(base_url, "/api/connect", {"ip": KEY_TV_HOST, "wait": True})
+        if connected["job"]["status"] != "ready":
+            raise RuntimeError(connected["message"])
+        results = {
+            "key_press": bench_key_latency(
+                base_url, farm, key_tv, args.presses, args.press_interval
+            ),
+            # Before the macro, which leaves the key rate limiter empty
+            "text": bench_text(base_url, controller, remote, farm, key_tv, TEXT_QUERY),
+            "macro": bench_macro_throughput(
+                base_url, farm, key_tv, args.macro_keys, args.macro_rounds
+            ),
+            "scan": bench_scan(remote, args.prefixes),
+            "neighbor_scan": bench_neighbor_scan(
+                controller, remote, farm, workdir, min(args.prefixes)
+            ),
+            "server": bench_throughput(base_url, args.clients, args.duration),
+            "startup": startup_result,
+        }
+    finally:
+        server.shutdown()
+        server.server_close()
+        controller.get_event_loop_thread().run(controller.get_session_pool().close_all(), 10)
+        dropped = sum(tv.dropped for tv in farm.tvs)
+        farm.close()
+
+    version, commit = version_info()
+    return {
+        "version": version,
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "emulator": {k: v for k, v in options.items() if k != "port"},
+        "dropped_connections": dropped,
+        "results": results,
+    }
+
+
+def report(data):
+    results = data["results"]
+    key = results["key_press"]
+    print(f"version:         {data['version']} ({data['commit']})")
+    print(f"key press:       p50 {key['p50_ms']} ms, p99 {key['p99_ms']} ms ({key['count']} presses)")
+    print(f"keys lost:       {key['lost']} presses, {results['macro']['lost']} macro keys")
+    print(f"macro:           {results['macro']['keys_per_second']} keys/s")
+    text = results["text"]
+    print(
+        f"text:            {text['chars']} chars in {text['typed_ms']} ms by {text['method']} "
+        f"(on-screen keyboard: {text['keyboard_keys']} keys)"
+    )
+    for scan in results["scan"]:
+        print(
+            f"scan {scan['network']:<16} {scan['hosts']:>5} hosts, "
+            f"{scan['tvs_found']} TVs, {scan['seconds']:.2f}s"
+        )
+    neighbor = results["neighbor_scan"]
+    print(
+        f"scan {neighbor['network']:<16} from {neighbor['neighbors']} neighbors, "
+        f"{neighbor['tvs_found']} TVs, {neighbor['seconds']:.3f}s"
+    )
+    server = results["server"]
+    print(f"server:          {server['requests_per_second']} req/s ({server['clients']} clients)")
+    print(
+        f"startup:         {results['startup']['listen_ms']} ms to listening "
+        f"({results['startup']['import_ms']} ms import)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.0, help="TV network latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latency jitter in seconds")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Chance a TV drops the channel per message")
+    parser.add_argument("--tv-port", type=int, default=8001)
+    parser.add_argument("--presses", type=int, default=50)
+    parser.add_argument("--press-interval", type=float, default=0.2, help="Seconds between key presses")
+    parser.add_argument("--macro-keys", type=int, default=100)
+    parser.add_argument("--macro-rounds", type=int, default=5)
+    parser.add_argument("--prefixes", type=int, nargs="+", default=list(SCAN_PREFIXES))
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds of throughput load")
+    parser.add_argument("--startup-runs", type=int, default=5)
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/<version>-<time>.json)")
+    args = parser.parse_args()
+    # run() moves into a scratch directory, so resolve the path first
+    output = os.path.abspath(args.output) if args.output else None
+
+    data = run(args)
+    report(data)
+    if not output:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(BENCHMARK_DIR, "results", f"{data['version']}-{stamp}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(data, f, indent=2)
+    print(f"results saved:   {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# benchmarks/startup.py
+"""Measure how quickly the controller starts and check it against a budget.
+
+Each sample runs in a fresh interpreter:
+
+- import: time to import samsung_tv_controller
+- listen: time from launching `python -m samsung_tv_controller` until its
+  port accepts connections
+- interpreter: time for `python -c pass`, which the controller cannot
+  influence and is subtracted before comparing against the budget
+
+Also checks that importing the module does not load the dependencies that
+are only needed once a TV is contacted. Exits with status 1 when over
+budget, so it can gate a change:
+
+    python benchmarks/startup.py --runs 10 --budget-ms 100
+"""
+import argparse
+import json
+import os
+import py_compile
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+CONTROLLER = os.path.join(REPO_DIR, "samsung_tv_controller.py")
+
+STARTUP_BUDGET_MS = 100
+# Only needed once a TV is contacted or a browser opened
+LAZY_MODULES = ("aiohttp", "samsungtvws", "wakeonlan", "brotli", "webbrowser")
+LISTEN_TIMEOUT = 30
+
+IMPORT_PROBE = f"""
+import json, sys, time
+sys.path.insert(0, {REPO_DIR!r})
+started = time.perf_counter()
+import samsung_tv_controller
+elapsed = time.perf_counter() - started
+print(json.dumps({{
+    "seconds": elapsed,
+    "eager": [m for m in {LAZY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def median_ms(samples):
+    return round(statistics.median(samples) * 1000, 1)
+
+
+def time_interpreter():
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return time.perf_counter() - started
+
+
+def time_import():
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output)
+
+
+def time_listen(workdir):
+    """Start the server and return seconds until its port accepts connections"""
+    # BROWSER=true makes the auto-open a no-op
+    env = dict(os.environ, BROWSER="true")
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-u", "-m", "samsung_tv_controller"],
+        cwd=workdir,
+        env=dict(env, PYTHONPATH=REPO_DIR),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    try:
+        port = None
+        for line in server.stdout:
+            match = re.search(r"http://localhost:(\d+)", line)
+            if match:
+                port = int(match.group(1))
+                break
+        if port is None:
+            raise RuntimeError("server exited before listening")
+        deadline = started + LISTEN_TIMEOUT
+        while True:
+            try:
+                socket.create_connection(("localhost", port), timeout=1).close()
+                return time.perf_counter() - started
+            except OSError:
+                if time.perf_counter() > deadline:
+                    raise
+                time.sleep(0.001)
+    finally:
+        server.kill()
+        server.wait()
+
+
+def run(runs):
+    workdir = tempfile.mkdtemp(prefix="tv-startup-")
+    # Every sample is a fresh process, but not the very first run, which
+    # also compiles the module. Run as a script, the module would be
+    # compiled on every start, which is why the CLI runs it with -m
+    py_compile.compile(CONTROLLER)
+    interpreter, imports, listens, eager = [], [], [], set()
+    for _ in range(runs):
+        interpreter.append(time_interpreter())
+        probe = time_import()
+        imports.append(probe["seconds"])
+        eager.update(probe["eager"])
+        listens.append(time_listen(workdir))
+    return {
+        "runs": runs,
+        "interpreter_ms": median_ms(interpreter),
+        "import_ms": median_ms(imports),
+        "listen_ms": median_ms(listens),
+        "listen_over_interpreter_ms": median_ms(listens) - median_ms(interpreter),
+        "eager_modules": sorted(eager),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    result = run(args.runs)
+    over = result["listen_over_interpreter_ms"] > args.budget_ms
+    if args.json:
+        print(json.dumps(dict(result, budget_ms=args.budget_ms), indent=2))
+    else:
+        print(f"interpreter:     {result['interpreter_ms']} ms")
+        print(f"import:          {result['import_ms']} ms")
+        print(
+            f"listening:       {result['listen_ms']} ms "
+            f"({result['listen_over_interpreter_ms']:.1f} ms over the interpreter, "
+            f"budget {args.budget_ms:g} ms)"
+        )
+        if result["eager_modules"]:
+            print(f"eager imports:   {', '.join(result['eager_modules'])}")
+    sys.exit(1 if over or result["eager_modules"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,11 @@ if (isElectronRuntime) {
     const { SamsungRemote, launchAppRest } = require('./tvClient');
 
     let mainWindow = null;
-    let remotes = new Map(); // key: ip -> SamsungRemote instance
+    // One shared socket per TV for every window. Each entry remembers which
+    // windows are using it, and the socket closes when the last one lets go.
+    let remotes = new Map(); // key: ip -> { remote, windows: Set<webContents id> }
+    // Windows that already release their remotes when destroyed
+    const watchedWindows = new Set();
     let tokens = {};
     let tokensFilePath = null;
 
@@ -31,6 +35,48 @@ if (isElectronRuntime) {
         }
     }
 
+    function getRemote(ip) {
+        const entry = remotes.get(ip);
+        return entry ? entry.remote : null;
+    }
+
+    function acquireRemote(ip, options, sender) {
+        let entry = remotes.get(ip);
+        if (entry && entry.remote.secure !== !!options.secure) {
+            // A different port needs its own socket; the old one is replaced for everyone
+            entry.remote.disconnect();
+            entry = null;
+        }
+        if (!entry) {
+            entry = { remote: new SamsungRemote({ ip, ...options }), windows: new Set() };
+            remotes.set(ip, entry);
+        }
+        entry.windows.add(sender.id);
+        watchWindow(sender);
+        return entry.remote;
+    }
+
+    function watchWindow(sender) {
+        // One listener per window, however often it connects and disconnects
+        if (watchedWindows.has(sender.id)) return;
+        const windowId = sender.id;
+        watchedWindows.add(windowId);
+        sender.once('destroyed', () => {
+            watchedWindows.delete(windowId);
+            for (const ip of [...remotes.keys()]) releaseRemote(ip, windowId);
+        });
+    }
+
+    function releaseRemote(ip, windowId) {
+        const entry = remotes.get(ip);
+        if (!entry) return;
+        entry.windows.delete(windowId);
+        if (!entry.windows.size) {
+            entry.remote.disconnect();
+            remotes.delete(ip);
+        }
+    }
+
     function createWindow() {
         // If you ever enable secure mode, some TVs have self-signed certs; Chromium requests
         // are unaffected here because we use node 'ws', but this prevents edge prompts.
@@ -69,16 +115,9 @@ if (isElectronRuntime) {
     // IPC handlers
     ipcMain.handle('connect', async(event, { ip, appName, secure }) => {
         try {
-            // Reuse if already connected
-            let remote = remotes.get(ip);
-            if (remote && remote.isConnected()) {
-                return { ok: true, secure, token: tokens[ip] || null };
-            }
-
-            const token = tokens[ip] || null;
-            remote = new SamsungRemote({ ip, appName, secure, token });
-            remotes.set(ip, remote);
-
+            // Windows connecting to the same TV share its socket, and a
+            // connect already in progress is joined rather than repeated
+            const remote = acquireRemote(ip, { appName, secure, token: tokens[ip] || null }, event.sender);
             const result = await remote.connect();
 
             // If TV returned/updated token on secure port, persist it
@@ -95,11 +134,9 @@ if (isElectronRuntime) {
     });
 
     ipcMain.handle('disconnect', async(event, { ip }) => {
-        const remote = remotes.get(ip);
-        if (!remote) return { ok: true };
         try {
-            remote.disconnect();
-            remotes.delete(ip);
+            // Only closes the socket once no other window is using it
+            releaseRemote(ip, event.sender.id);
             return { ok: true };
         } catch (err) {
             return { ok: false, error: String(err) };
@@ -107,20 +144,20 @@ if (isElectronRuntime) {
     });
 
     ipcMain.handle('send-key', async(event, { ip, key }) => {
-        const remote = remotes.get(ip);
+        const remote = getRemote(ip);
         if (!remote || !remote.isConnected()) {
             return { ok: false, error: 'Not connected' };
         }
         try {
-            await remote.sendKey(key);
-            return { ok: true };
+            const { id, status } = await remote.sendKey(key);
+            return { ok: true, id, status };
         } catch (err) {
-            return { ok: false, error: String(err) };
+            return { ok: false, id: err.id, status: 'failed', error: String(err) };
         }
     });
 
     ipcMain.handle('send-text', async(event, { ip, text }) => {
-        const remote = remotes.get(ip);
+        const remote = getRemote(ip);
         if (!remote || !remote.isConnected()) {
             return { ok: false, error: 'Not connected' };
         }
@@ -152,7 +189,7 @@ if (isElectronRuntime) {
 
     // List installed apps (requires secure connection and supported TVs)
     ipcMain.handle('list-apps', async(event, { ip }) => {
-        const remote = remotes.get(ip);
+        const remote = getRemote(ip);
         if (!remote || !remote.isConnected()) {
             return { ok: false, error: 'Not connected' };
         }
@@ -167,7 +204,7 @@ if (isElectronRuntime) {
     // Launch app by id or fuzzy name, with fallbacks
     ipcMain.handle('launch-app', async(event, { ip, appId, appName }) => {
         console.log('Launch app request:', { ip, appId, appName });
-        const remote = remotes.get(ip);
+        const remote = getRemote(ip);
         const isConnected = Boolean(remote && remote.isConnected());
         console.log('Connection status:', isConnected);
 
@@ -185,15 +222,17 @@ if (isElectronRuntime) {
                     console.log('Attempting WebSocket launch...');
                     const wsResult = await remote.launchApp(id);
                     console.log('WebSocket launch result:', wsResult);
-                    // Note: Samsung TVs often don't send a proper response for app launches
-                    // So we'll also try REST as a backup
+                    if (wsResult && wsResult.status === 'acknowledged') {
+                        // The TV confirmed the launch; REST would only start it twice
+                        return true;
+                    }
                     wsSuccess = true;
                 } catch (wsError) {
                     console.log('WebSocket launch failed:', wsError.message);
                 }
             }
             
-            // Always try REST as well, as some Samsung TVs respond better to REST API
+            // Unconfirmed launches also go through REST, as some Samsung TVs respond better to it
             try {
                 console.log('Attempting REST launch...');
                 await launchAppRest(ip, id, remote ? remote.secure : false);
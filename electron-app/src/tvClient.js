@@ -2,19 +2,25 @@ const WebSocket = require('ws');
 const http = require('http');
 const https = require('https');
 
+// Long enough to accept the pairing prompt on the TV, which times out by itself
+const CONNECT_TIMEOUT_MS = 30000;
+
 function b64(str) {
     return Buffer.from(String(str), 'utf8').toString('base64');
 }
 
 class SamsungRemote {
-    constructor({ ip, appName = 'Electron Remote', secure = false, token = null }) {
+    constructor({ ip, appName = 'Electron Remote', secure = false, token = null, connectTimeout = CONNECT_TIMEOUT_MS }) {
         this.ip = ip;
         this.appName = appName;
         this.secure = !!secure;
         this.token = token || null;
+        this.connectTimeout = connectTimeout;
         this.ws = null;
         this._connected = false;
         this._connectPromise = null;
+        this._seq = 0;
+        this._waiters = {};
     }
 
     isConnected() {
@@ -30,6 +36,10 @@ class SamsungRemote {
         return `ws://${this.ip}:8001/api/v2/channels/samsung.remote.control?${nameParam}`;
     }
 
+    // Resolves as soon as the TV reports the channel ready (ms.channel.connect),
+    // which on the secure port also carries the pairing token. Concurrent calls
+    // share one attempt. A TV that accepts the socket but never reports the
+    // channel ready is given up on after connectTimeout.
     connect() {
         if (this.isConnected()) {
             return Promise.resolve({ token: this.token || null });
@@ -42,146 +52,166 @@ class SamsungRemote {
         this._connectPromise = new Promise((resolve, reject) => {
             const ws = new WebSocket(url, opts);
             this.ws = ws;
+            let settled = false;
+            let timer = null;
 
-            const onError = (err) => {
-                this._connected = false;
-                cleanup();
-                reject(err);
-            };
-
-            const onOpen = () => {
-                this._connected = true;
-                // Connection is open. Token might be provided in a subsequent message.
+            const settle = (err) => {
+                if (settled) return;
+                settled = true;
+                clearTimeout(timer);
+                if (err) {
+                    this._connectPromise = null;
+                    reject(err);
+                } else {
+                    this._connected = true;
+                    this._connectPromise = null;
+                    resolve({ token: this.token || null });
+                }
             };
 
-            const onMessage = (data) => {
+            // One listener per socket; every reply is routed by its event type
+            ws.on('message', (data) => {
+                let msg;
                 try {
-                    const msg = JSON.parse(data.toString());
-                    // On secure port, after approval, TV can send token in an ms.channel.connect event.
-                    if (msg.event === 'ms.channel.connect' && msg.data && msg.data.token) {
-                        this.token = msg.data.token;
-                        // We can resolve here with the token if still pending
-                        if (this._connectPromise) {
-                            const p = this._connectPromise;
-                            this._connectPromise = null;
-                            resolve({ token: this.token });
-                        }
-                    }
+                    msg = JSON.parse(data.toString());
                 } catch (_) {
-                    // Ignore parse errors
+                    return;
                 }
-            };
-
-            const onClose = () => {
-                this._connected = false;
-                cleanup();
-            };
-
-            const cleanup = () => {
-                if (!ws) return;
-                if (typeof ws.off === 'function') {
-                    ws.off('open', onOpen);
-                    ws.off('message', onMessage);
-                    ws.off('error', onError);
-                    ws.off('close', onClose);
-                } else if (typeof ws.removeListener === 'function') {
-                    ws.removeListener('open', onOpen);
-                    ws.removeListener('message', onMessage);
-                    ws.removeListener('error', onError);
-                    ws.removeListener('close', onClose);
+                if (msg.event === 'ms.channel.connect') {
+                    if (msg.data && msg.data.token) this.token = msg.data.token;
+                    settle();
+                } else if (msg.event === 'ms.channel.unauthorized' || msg.event === 'ms.channel.timeOut') {
+                    settle(new Error(`TV refused the connection (${msg.event})`));
+                    ws.close();
                 }
-            };
-
-            ws.on('open', onOpen);
-            ws.on('message', onMessage);
-            ws.on('error', onError);
-            ws.on('close', onClose);
-
-            // Give it a little time to emit token; if none and we’re open, resolve anyway
-            const fallbackResolveTimeout = setTimeout(() => {
-                if (this.isConnected()) {
-                    const p = this._connectPromise;
-                    this._connectPromise = null;
-                    resolve({ token: this.token || null });
+                this._dispatch(msg);
+            });
+            ws.on('error', (err) => {
+                settle(err);
+            });
+            ws.on('close', () => {
+                if (this.ws === ws) {
+                    this._connected = false;
+                    this.ws = null;
+                    this._failWaiters(new Error('Socket closed'));
                 }
-            }, 1200);
-
-            // Ensure timeout cleared once promise settles
-            const originalResolve = resolve;
-            resolve = (val) => {
-                clearTimeout(fallbackResolveTimeout);
-                originalResolve(val);
-            };
-            const originalReject = reject;
-            reject = (err) => {
-                clearTimeout(fallbackResolveTimeout);
-                originalReject(err);
-            };
+                settle(new Error('Socket closed before the TV accepted the connection'));
+            });
+            timer = setTimeout(() => {
+                const err = new Error('Timed out waiting for the TV to accept the connection');
+                settle(err);
+                if (this.ws === ws) {
+                    this.ws = null;
+                    this._failWaiters(err);
+                }
+                ws.terminate();
+            }, this.connectTimeout);
         });
 
         return this._connectPromise;
     }
 
     disconnect() {
-        try {
-            if (this.ws) {
-                this.ws.close();
-            }
-        } catch (_) {}
+        const ws = this.ws;
         this._connected = false;
         this.ws = null;
         this._connectPromise = null;
+        this._failWaiters(new Error('Socket closed'));
+        try {
+            if (ws) ws.close();
+        } catch (_) {}
     }
 
-    _send(payload) {
+    // Every command gets a sequence id and settles with its outcome:
+    // 'acknowledged' when the TV replied, 'delivered' when it was written but
+    // the TV sent no reply, or a rejected promise with status 'failed'.
+    // Commands are not serialised, so callers can pipeline them.
+    _send(payload, { ackEvent = null, ackTimeout = 3000 } = {}) {
+        const id = ++this._seq;
         return new Promise((resolve, reject) => {
-            if (!this.isConnected()) return reject(new Error('Socket not connected'));
-            
-            // Set up response listener for launch commands
-            let responseHandler = null;
-            if (payload.params && payload.params.event === 'ed.apps.launch') {
-                const timeout = setTimeout(() => {
-                    console.log('Launch command timeout - no response from TV');
-                    if (responseHandler) this.ws.removeListener('message', responseHandler);
-                    resolve('timeout'); // Don't reject, as Samsung TVs often don't respond to launch
-                }, 3000);
-                
-                responseHandler = (data) => {
-                    try {
-                        const msg = JSON.parse(data.toString());
-                        console.log('TV response to launch command:', JSON.stringify(msg));
-                        if (msg.event === 'ed.apps.launch' || msg.params?.event === 'ed.apps.launch') {
-                            clearTimeout(timeout);
-                            this.ws.removeListener('message', responseHandler);
-                            resolve(msg);
+            const fail = (err) => {
+                err.id = id;
+                err.status = 'failed';
+                reject(err);
+            };
+            if (!this.isConnected()) return fail(new Error('Socket not connected'));
+
+            let waiter = null;
+            if (ackEvent) {
+                waiter = this._addWaiter(ackEvent, ackTimeout, {
+                    reply: (msg) => {
+                        if (msg.data === undefined || msg.data === 200 || msg.data === '200') {
+                            resolve({ id, status: 'acknowledged', response: msg });
+                        } else {
+                            fail(new Error(`TV replied ${JSON.stringify(msg.data)}`));
                         }
-                    } catch (e) {
-                        // Ignore parse errors
-                    }
-                };
-                this.ws.on('message', responseHandler);
+                    },
+                    timeout: () => resolve({ id, status: 'delivered' }),
+                    error: fail
+                });
             }
-            
+
+            const onSendError = (err) => {
+                if (waiter) this._removeWaiter(ackEvent, waiter);
+                fail(err);
+            };
             try {
                 this.ws.send(JSON.stringify(payload), (err) => {
                     if (err) {
-                        if (responseHandler) {
-                            this.ws.removeListener('message', responseHandler);
-                        }
-                        reject(err);
-                    } else if (!responseHandler) {
-                        resolve();
+                        onSendError(err);
+                    } else if (!waiter) {
+                        resolve({ id, status: 'delivered' });
                     }
                 });
             } catch (e) {
-                if (responseHandler) {
-                    this.ws.removeListener('message', responseHandler);
-                }
-                reject(e);
+                onSendError(e);
             }
         });
     }
 
+    // Replies carry no request id, so each event type keeps a FIFO of waiters
+    // and a reply settles the oldest one. Registered before the request is
+    // written, so a fast reply cannot be missed.
+    _addWaiter(event, timeout, handlers) {
+        const waiter = {
+            handlers,
+            timer: setTimeout(() => {
+                this._removeWaiter(event, waiter);
+                handlers.timeout();
+            }, timeout)
+        };
+        (this._waiters[event] = this._waiters[event] || []).push(waiter);
+        return waiter;
+    }
+
+    _removeWaiter(event, waiter) {
+        clearTimeout(waiter.timer);
+        const waiters = this._waiters[event] || [];
+        const index = waiters.indexOf(waiter);
+        if (index !== -1) waiters.splice(index, 1);
+        if (!waiters.length) delete this._waiters[event];
+    }
+
+    _dispatch(msg) {
+        const waiters = this._waiters[msg.event];
+        if (waiters && waiters.length) {
+            const waiter = waiters[0];
+            this._removeWaiter(msg.event, waiter);
+            waiter.handlers.reply(msg);
+        }
+    }
+
+    _failWaiters(err) {
+        const waiters = this._waiters;
+        this._waiters = {};
+        for (const event of Object.keys(waiters)) {
+            for (const waiter of waiters[event]) {
+                clearTimeout(waiter.timer);
+                waiter.handlers.error(err);
+            }
+        }
+    }
+
     // Remote key press (e.g., KEY_VOLUP, KEY_HOME, KEY_POWER, KEY_1)
     sendKey(key) {
         const payload = {
@@ -210,60 +240,38 @@ class SamsungRemote {
         return this._send(payload);
     }
 
-    // Query installed apps via REST helper available through TV HTTP API (only on newer models)
+    // Query installed apps over the channel (only on newer models)
     async listApps() {
-        // Many TVs expose app list at ws API as well via remote.register/information calls,
-        // but a common approach is to call app list REST on 8001/8002. We'll try via WebSocket first.
-        return new Promise((resolve, reject) => {
-            if (!this.isConnected()) return reject(new Error('Socket not connected'));
-            const requestId = `apps_${Date.now()}_${Math.random().toString(36).slice(2)}`;
-            const payload = {
-                method: 'ms.channel.emit',
-                params: {
-                    event: 'ed.installedApp.get',
-                    to: 'host',
-                    data: { id: requestId }
-                }
-            };
-
-            let timeout = null;
-            const onMessage = (data) => {
-                try {
-                    const msg = JSON.parse(data.toString());
-                    if (msg.event === 'ed.installedApp.get' && msg.data && msg.data.data) {
-                        cleanup();
-                        const appsRaw = msg.data.data || [];
-                        const apps = appsRaw.map((a) => ({
-                            id: a.appId || a.id,
-                            appId: a.appId || a.id,
-                            name: a.name || a.appName || a.title || 'Unknown'
-                        }));
-                        resolve(apps);
-                    }
-                } catch (_) {
-                    // ignore
-                }
-            };
-            const cleanup = () => {
-                clearTimeout(timeout);
-                if (this.ws) {
-                    if (typeof this.ws.off === 'function') {
-                        this.ws.off('message', onMessage);
-                    } else if (typeof this.ws.removeListener === 'function') {
-                        this.ws.removeListener('message', onMessage);
-                    }
-                }
-            };
-            this.ws.on('message', onMessage);
-            this._send(payload).catch((e) => {
-                cleanup();
-                reject(e);
+        if (!this.isConnected()) throw new Error('Socket not connected');
+        const requestId = `apps_${Date.now()}_${Math.random().toString(36).slice(2)}`;
+        const payload = {
+            method: 'ms.channel.emit',
+            params: {
+                event: 'ed.installedApp.get',
+                to: 'host',
+                data: { id: requestId }
+            }
+        };
+        const event = 'ed.installedApp.get';
+        let waiter = null;
+        const reply = new Promise((resolve, reject) => {
+            waiter = this._addWaiter(event, 4000, {
+                reply: resolve,
+                timeout: () => reject(new Error('App list timed out')),
+                error: reject
             });
-            timeout = setTimeout(() => {
-                cleanup();
-                reject(new Error('App list timed out'));
-            }, 4000);
         });
+        const sent = this._send(payload).catch((e) => {
+            this._removeWaiter(event, waiter);
+            throw e;
+        });
+        const [, msg] = await Promise.all([sent, reply]);
+        const appsRaw = (msg.data && msg.data.data) || [];
+        return appsRaw.map((a) => ({
+            id: a.appId || a.id,
+            appId: a.appId || a.id,
+            name: a.name || a.appName || a.title || 'Unknown'
+        }));
     }
 
     // Launch app by id
@@ -310,7 +318,8 @@ class SamsungRemote {
             const payload = methods[i];
             console.log(`Trying WebSocket launch method ${i + 1}:`, JSON.stringify(payload));
             try {
-                const result = await this._send(payload);
+                const ackEvent = payload.params.event === 'ed.apps.launch' ? 'ed.apps.launch' : null;
+                const result = await this._send(payload, { ackEvent });
                 console.log(`WebSocket launch method ${i + 1} response:`, result);
                 return result;
             } catch (e) {
@@ -1,100 +1,2697 @@
 # samsung_tv_web_remote.py
+import asyncio
+import atexit
+import base64
+import collections
+import copy
+import gzip
+import contextlib
+import hashlib
 import json
+import logging
 import os
+import queue
+import re
 import threading
-import webbrowser
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
-from samsungtvws import SamsungTVWS
 import socket
+import struct
+import subprocess
 import ipaddress
 import concurrent.futures
 import time
+import weakref
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Errors and warnings; scan progress and the server banner are printed
+logger = logging.getLogger("samsung_tv_controller")
+
+# aiohttp, samsungtvws, wakeonlan, brotli, mimetypes and webbrowser take
+# most of the import time, so they are imported where first used and the
+# server starts listening without them
+
+# Samsung TVs expose the remote-control API on 8001 (ws/http) and 8002 (wss/https)
+SCAN_PORTS = (8001, 8002)
+SCAN_CONCURRENCY = 512
+SCAN_PROBE_TIMEOUT = 0.5
+SCAN_INFO_TIMEOUT = 2.0
+SCAN_TIMEOUT = 30
+# Networks wider than this (2046 hosts) are only swept in the block around
+# our address; the scan_max_prefix setting overrides it
+SCAN_MAX_PREFIX = 21
+NEIGHBOR_TABLE_FILE = "/proc/net/arp"
+NEIGHBOR_COMMAND_TIMEOUT = 1
+SAMSUNG_OUI_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "samsung_oui.txt")
+EVENT_LOOP_WORKERS = 4
+
+DISCOVERY_MODES = ("passive", "active", "hybrid")
+DISCOVERY_LISTEN_TIMEOUT = 0.6
+SSDP_ADDRESS = ("239.255.255.250", 1900)
+SSDP_SEARCH_TARGETS = (
+    "urn:samsung.com:device:RemoteControlReceiver:1",
+    "urn:dial-multiscreen-org:service:dial:1",
+)
+MDNS_ADDRESS = ("224.0.0.251", 5353)
+MDNS_SERVICE = "_samsungmsf._tcp.local"
+
+APP_NAME = "SamsungTvRemote"
+LEGACY_TOKEN_FILE = os.path.dirname(os.path.realpath(__file__)) + "/tv-token.txt"
+TOKEN_STORE_FILE = os.path.dirname(os.path.realpath(__file__)) + "/tv-tokens.json"
+# Port used for the remote-control channel when connecting to a TV
+TV_PORT = 8002
+SESSION_TIMEOUT = 10
+SESSION_HEARTBEAT_INTERVAL = 15
+SESSION_HEARTBEAT_TIMEOUT = 5
+SESSION_RECONNECT_ATTEMPTS = 3
+SESSION_BACKOFF_BASE = 0.5
+SESSION_BACKOFF_MAX = 8
+COMMAND_TIMEOUT = 15
+UPNP_PORT = 9197
+UPNP_TIMEOUT = 2
+VOLUME_KEYS = ("KEY_VOLUP", "KEY_VOLDOWN", "KEY_MUTE")
+EVENT_STREAM_KEEPALIVE = 15
+EVENT_STREAM_MAX_CLIENTS = 16
+POWER_OFF_KEYS = ("KEY_POWER", "KEY_POWEROFF")
+POWER_OFF_WINDOW = 10
+# Wake-on-LAN: packets are repeated until the TV answers, which is polled
+# with short TCP probes so it is noticed as soon as it boots
+WAKE_TIMEOUT = 30
+WAKE_PACKET_INTERVAL = 1
+WAKE_POLL_INTERVAL = 0.1
+WAKE_PROBE_TIMEOUT = 0.3
+WAKE_INFO_TIMEOUT = 1
+HTTP_WORKERS = 32
+# Connections waiting to be accepted; the default of 5 makes bursts from
+# many clients wait out SYN retransmits (about a second each)
+HTTP_LISTEN_BACKLOG = HTTP_WORKERS * 4
+KEY_INTERVAL = 0.1
+KEY_SEQUENCE_MAX_KEYS = 100
+KEY_SEQUENCE_MAX_DELAY = 5
+KEY_ACTIONS = ("click", "press", "release")
+# Per-TV token bucket: sustained keys per second and how many may burst
+KEY_RATE_LIMIT = 20
+KEY_RATE_BURST = 10
+# The same key arriving this many times, each within the window of the
+# last, is keyboard autorepeat and is turned into a held key
+KEY_BURST_WINDOW = 0.15
+KEY_BURST_THRESHOLD = 3
+# A held key is released after this long even if no release arrives
+KEY_HOLD_MAX = 10
+# A release arriving this soon before its press overtook it on the way in;
+# the press is then sent as a single click instead of holding the key
+KEY_EARLY_RELEASE_WINDOW = 0.5
+# Queued commands are retried until their deadline; commands the TV answers
+# (app launches) wait this long for the reply before being sent again
+COMMAND_DEADLINE = 8
+COMMAND_ACK_TIMEOUT = 3
+COMMAND_RETRY_DELAY = 0.25
+# Text is sent in one SendInputString frame while the TV's input method is
+# open, otherwise typed on the on-screen keyboard. The default layout
+# approximates the Tizen QWERTY keyboard; focus starts on its first key
+TEXT_METHODS = ("auto", "ime", "keyboard")
+TEXT_MAX_LENGTH = 128
+KEYBOARD_LAYOUT = ("1234567890", "qwertyuiop", "asdfghjkl-", "zxcvbnm,.@", " ")
+KEYBOARD_MOVES = (("KEY_UP", -1, 0), ("KEY_DOWN", 1, 0), ("KEY_LEFT", 0, -1), ("KEY_RIGHT", 0, 1))
+COMMAND_HISTORY = 256
+# Background connects report progress by job ID; this many are remembered
+CONNECT_JOB_HISTORY = 64
+
+APP_CACHE_DIR = "app_cache"
+APP_CACHE_TTL = 3600
+APP_ICON_TIMEOUT = 5
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "static")
+STATIC_MAX_AGE = 3600
+
+FLEET_FILE = "tv_fleet.json"
+FLEET_CONCURRENCY = 64
+# Registering waits this long for the TV's device info; a TV that doesn't
+# answer is kept under its IP and identified when a command first reaches it
+FLEET_VERIFY_TIMEOUT = 3
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+HTTP_ROUTES = (
+    "/",
+    "/api/status",
+    "/api/events",
+    "/api/apps",
+    "/api/apps/icon",
+    "/api/scan",
+    "/api/fleet",
+    "/api/connect",
+    "/api/connect/status",
+    "/api/key",
+    "/api/keys",
+    "/api/text",
+    "/api/launch",
+    "/api/commands",
+    "/api/power_on",
+    "/api/fleet/register",
+    "/api/fleet/remove",
+    "/api/fleet/connect",
+    "/api/fleet/key",
+    "/api/fleet/launch",
+    "/api/fleet/power_on",
+    "/metrics",
+)
+
+# Settings, tokens, fleet and caches are JSON files carrying this version;
+# changes are written this many seconds after the first unsaved one
+STORE_SCHEMA_VERSION = 1
+STORE_SAVE_DELAY = 1.0
+
+DISCOVERY_CACHE_FILE = "tv_discovery.json"
+DISCOVERY_CACHE_TTL = 600
+DISCOVERY_CACHE_MAX_AGE = 7 * 24 * 3600
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in items
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+class Counter:
+    """Prometheus-style counter with labels"""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Prometheus-style histogram with labels and fixed buckets"""
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._values.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    bucket = _format_labels(labels, ("le", bound))
+                    lines.append(f"{self.name}_bucket{bucket} {bucket_count}")
+                bucket = _format_labels(labels, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{bucket} {count}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them in Prometheus text format
+
+    When a log file is set, every tracked operation is also appended to it
+    as one JSON object per line.
+    """
 
-class SamsungTVRemote:
     def __init__(self):
+        self.metrics = []
+        self.log_file = None
+        self._log_lock = threading.Lock()
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def log(self, record):
+        if not self.log_file:
+            return
+        line = json.dumps(dict(record, ts=round(time.time(), 3)))
+        try:
+            with self._log_lock:
+                if self.log_file == "-":
+                    print(line, flush=True)
+                else:
+                    with open(self.log_file, "a") as f:
+                        f.write(line + "\n")
+        except Exception as e:
+            logger.warning("Error writing metrics log: %s", e)
+
+    @contextlib.contextmanager
+    def track(self, histogram, counter, **labels):
+        """Time a block and count it as a success, failure or timeout"""
+        started = time.perf_counter()
+        outcome = "success"
+        try:
+            yield
+        except TimeoutError:
+            outcome = "timeout"
+            raise
+        except BaseException:
+            outcome = "failure"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            histogram.observe(elapsed, **labels)
+            counter.inc(outcome=outcome, **labels)
+            self.log(
+                {
+                    "metric": histogram.name,
+                    "seconds": round(elapsed, 6),
+                    "outcome": outcome,
+                    **labels,
+                }
+            )
+
+
+metrics = MetricsRegistry()
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "tv_remote_http_request_seconds", "Time spent handling HTTP requests"
+)
+HTTP_REQUESTS = metrics.counter(
+    "tv_remote_http_requests_total", "HTTP requests by endpoint and outcome"
+)
+TV_COMMAND_SECONDS = metrics.histogram(
+    "tv_remote_tv_command_seconds", "TV WebSocket and REST round-trip time"
+)
+TV_COMMANDS = metrics.counter(
+    "tv_remote_tv_commands_total", "TV commands by TV, command and outcome"
+)
+TV_CONNECT_SECONDS = metrics.histogram(
+    "tv_remote_tv_connect_seconds", "TV WebSocket connect and handshake time"
+)
+TV_CONNECTS = metrics.counter(
+    "tv_remote_tv_connects_total", "TV connection attempts by TV and outcome"
+)
+TV_WAKE_SECONDS = metrics.histogram(
+    "tv_remote_tv_wake_seconds", "Time from Wake-on-LAN to the first usable key press"
+)
+SCAN_PROBE_SECONDS = metrics.histogram(
+    "tv_remote_scan_probe_seconds", "Time to probe one host during discovery"
+)
+
+
+class EventLoopThread:
+    """Run a private asyncio event loop on a daemon thread"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        # Keep the number of helper threads bounded no matter how many
+        # coroutines are in flight
+        self.loop.set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(max_workers=EVENT_LOOP_WORKERS)
+        )
+        self._thread = threading.Thread(
+            target=self.loop.run_forever, name="tv-event-loop", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop and return a concurrent future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and block until it finishes"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+
+_event_loop_thread = None
+_event_loop_lock = threading.Lock()
+
+
+def get_event_loop_thread():
+    """Return the shared background event loop, starting it on first use"""
+    global _event_loop_thread
+    with _event_loop_lock:
+        if _event_loop_thread is None:
+            _event_loop_thread = EventLoopThread()
+        return _event_loop_thread
+
+
+def tv_identity(info, fallback):
+    """Return a stable identity for a TV from its REST device info
+
+    The Wi-Fi MAC survives DHCP changes, so it is preferred over the DUID;
+    the fallback (usually the IP) is only used when neither is reported.
+    """
+    device = info.get("device", {})
+    mac = mac_identity(device.get("wifiMac", ""))
+    return mac or device.get("duid") or info.get("id") or fallback
+
+
+def mac_identity(mac):
+    """Return the identity tv_identity() gives a TV with this MAC"""
+    return mac.replace(":", "").lower()
+
+
+class JSONStore:
+    """A JSON file held in memory and written back in debounced batches
+
+    The file is read on first access. Changes are collected and written
+    together `delay` seconds after the first one, and on exit, to a temp
+    file that is renamed over the original, so no reader ever sees half a
+    file. Writers in other processes are kept out by an exclusive lock on
+    <path>.lock, and only what this process changed is written over the
+    file on disk, so their updates are not lost: other keys are kept, and
+    so are other entries of a dict value, or of a list value whose records
+    are named by a field given in entry_keys. Files from a newer schema
+    version are read but never overwritten. With path=None nothing is
+    written.
+    """
+
+    def __init__(self, path, delay=STORE_SAVE_DELAY, mode=0o644, entry_keys=None):
+        self.path = path
+        self.delay = delay
+        self.mode = mode
+        self.entry_keys = entry_keys or {}
+        self.read_only = False
+        self._data = None
+        # Each key as last read from or written to disk, to tell our changes apart
+        self._saved = {}
+        self._dirty = set()
+        self._timer = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        _open_stores.add(self)
+
+    def _read(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            data = json.load(f)
+        version = data.pop("version", 1)
+        if version > STORE_SCHEMA_VERSION:
+            logger.warning("%s is from a newer version; it will not be changed", self.path)
+            self.read_only = True
+        return data
+
+    def _load(self):
+        if self._data is not None:
+            return
+        try:
+            self._data = self._read()
+        except Exception as e:
+            logger.warning("Error loading %s: %s", self.path, e)
+            self._data = {}
+        self._saved = copy.deepcopy(self._data)
+
+    def get(self, key, default=None):
+        """Return a value; callers must not modify it in place"""
+        with self._lock:
+            self._load()
+            return self._data.get(key, default)
+
+    def update(self, values):
+        """Change several keys and schedule one write for all of them"""
+        with self._lock:
+            self._load()
+            changed = {k: v for k, v in values.items() if self._data.get(k) != v}
+            if not changed:
+                return
+            self._data.update(changed)
+            self._dirty.update(changed)
+            if self._timer is None and self.path:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def set(self, key, value):
+        self.update({key: value})
+
+    def _entries(self, key, value):
+        # A dict or list value as {entry key: entry}, or None for a plain value
+        if isinstance(value, dict):
+            return value
+        field = self.entry_keys.get(key)
+        if field and isinstance(value, list):
+            return {entry[field]: entry for entry in value}
+        return None
+
+    def _merge(self, key, current, saved, ours):
+        """Apply the entries of key changed since `saved` to the file's `current`"""
+        ours_entries = self._entries(key, ours)
+        saved_entries = self._entries(key, saved) or {}
+        merged = self._entries(key, current)
+        if ours_entries is None or merged is None:
+            return ours
+        merged = dict(merged)
+        for name in set(saved_entries) | set(ours_entries):
+            if name not in ours_entries:
+                merged.pop(name, None)
+            elif saved_entries.get(name) != ours_entries[name]:
+                merged[name] = ours_entries[name]
+        return merged if isinstance(ours, dict) else list(merged.values())
+
+    def flush(self):
+        """Write pending changes now"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty or not self.path or self.read_only:
+                return
+            changes = {key: copy.deepcopy(self._data[key]) for key in self._dirty}
+            saved = {key: self._saved.get(key) for key in changes}
+            self._dirty.clear()
+        with self._write_lock:
+            try:
+                with open(f"{self.path}.lock", "a") as lock_file:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX)
+                    data = self._read()
+                    if self.read_only:
+                        return
+                    for key, value in changes.items():
+                        data[key] = self._merge(key, data.get(key), saved[key], value)
+                    tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, self.mode)
+                    with os.fdopen(fd, "w") as f:
+                        json.dump({"version": STORE_SCHEMA_VERSION, **data}, f)
+                    os.replace(tmp_path, self.path)
+            except Exception as e:
+                logger.warning("Error saving %s: %s", self.path, e)
+                with self._lock:
+                    # Retried with the next change or on exit
+                    self._dirty.update(changes)
+                return
+        with self._lock:
+            # Pick up what other processes wrote meanwhile. A key changed
+            # again during the write keeps our value, and is merged against
+            # what it was based on next time.
+            for key, value in data.items():
+                if key in self._dirty:
+                    self._saved[key] = changes.get(key, self._saved.get(key))
+                else:
+                    self._data[key] = value
+                    self._saved[key] = copy.deepcopy(value)
+
+
+_open_stores = weakref.WeakSet()
+
+
+@atexit.register
+def flush_stores():
+    """Write every store's pending changes"""
+    for store in list(_open_stores):
+        store.flush()
+
+
+class TokenStore:
+    """Pairing tokens keyed by TV identity, cached in memory
+
+    Saved straight away rather than debounced, as a lost token means
+    accepting the prompt on the TV again.
+    """
+
+    def __init__(self, path=TOKEN_STORE_FILE, legacy_path=LEGACY_TOKEN_FILE):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._store = JSONStore(path, mode=0o600)
+        self._legacy_token = None
+        self._legacy_loaded = False
+        self._lock = threading.Lock()
+
+    def _load_legacy(self):
+        if self._legacy_loaded:
+            return
+        self._legacy_loaded = True
+        try:
+            if self.legacy_path and os.path.exists(self.legacy_path):
+                with open(self.legacy_path, "r") as f:
+                    self._legacy_token = f.readline().strip() or None
+        except Exception as e:
+            logger.warning("Error loading tokens: %s", e)
+
+    def get(self, identity):
+        """Return the token for a TV, falling back to the old shared token"""
+        with self._lock:
+            self._load_legacy()
+            return self._store.get("tokens", {}).get(identity) or self._legacy_token
+
+    def has_token(self, identity):
+        """Whether this TV has paired with us, ignoring the old shared token"""
+        with self._lock:
+            return bool(self._store.get("tokens", {}).get(identity))
+
+    def set(self, identity, token):
+        with self._lock:
+            tokens = self._store.get("tokens", {})
+            if tokens.get(identity) == token:
+                return
+            self._store.set("tokens", dict(tokens, **{identity: token}))
+        self._store.flush()
+
+
+_token_store = TokenStore()
+
+
+def get_token_store():
+    """Return the process-wide token store"""
+    return _token_store
+
+
+class TokenBucket:
+    """Async token bucket; acquire() waits in order until a token is free"""
+
+    def __init__(self, rate=KEY_RATE_LIMIT, capacity=KEY_RATE_BURST):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _keyboard_routes(layout, start, wrap=False):
+    """Return the shortest arrow-key route from start to every key of layout"""
+    routes = {start: []}
+    pending = collections.deque([start])
+    while pending:
+        row, column = pending.popleft()
+        for key, row_step, column_step in KEYBOARD_MOVES:
+            next_row = row + row_step
+            if wrap:
+                next_row %= len(layout)
+            if not 0 <= next_row < len(layout):
+                continue
+            width = len(layout[next_row])
+            next_column = column + column_step
+            if wrap and row_step == 0:
+                next_column %= width
+            elif row_step:
+                # Moving onto a shorter row lands on its last key
+                next_column = min(next_column, width - 1)
+            if not 0 <= next_column < width:
+                continue
+            target = (next_row, next_column)
+            if target not in routes:
+                routes[target] = routes[(row, column)] + [key]
+                pending.append(target)
+    return routes
+
+
+def keyboard_case_changes(text, layout=KEYBOARD_LAYOUT):
+    """Return the characters of text only found on layout in the other case"""
+    chars = set("".join(layout))
+    return sorted({char for char in text if char not in chars and char.swapcase() in chars})
+
+
+def plan_keyboard_path(text, layout=KEYBOARD_LAYOUT, wrap=False, fold_case=False):
+    """Return the keys that type text on the TV's on-screen keyboard
+
+    layout lists the keyboard's rows from the top, with focus on the first
+    key. Each character is reached by the fewest arrow keys from the last
+    one typed and selected with KEY_ENTER; a character on several keys
+    uses the nearest. A character missing from the layout raises
+    ValueError naming every such character, unless fold_case is set and
+    the layout has it in the other case.
+    """
+    positions = {}
+    for row, keys in enumerate(layout):
+        for column, char in enumerate(keys):
+            positions.setdefault(char, []).append((row, column))
+    missing = sorted(
+        {
+            char
+            for char in text
+            if char not in positions and not (fold_case and char.swapcase() in positions)
+        }
+    )
+    if missing:
+        names = ", ".join(repr(char) for char in missing)
+        raise ValueError(f"Can't type {names} on the on-screen keyboard")
+    routes = {}
+    position = (0, 0)
+    keys = []
+    for char in text:
+        targets = positions.get(char) or positions[char.swapcase()]
+        if position not in routes:
+            routes[position] = _keyboard_routes(layout, position, wrap)
+        route = routes[position]
+        reachable = [target for target in targets if target in route]
+        if not reachable:
+            raise ValueError(f"Can't reach {char!r} on the on-screen keyboard")
+        position = min(reachable, key=lambda target: len(route[target]))
+        keys.extend(route[position])
+        keys.append("KEY_ENTER")
+    return keys
+
+
+class KeyCoalescer:
+    """Turns repeated key presses for one TV into held keys
+
+    Single presses go out as Click. When the same key keeps arriving faster
+    than KEY_BURST_WINDOW (keyboard autorepeat), it is sent once as Press
+    and the rest of the burst is merged into it until the key goes quiet,
+    when Release is sent; the TV then repeats the key at its own pace.
+    Explicit press()/release() hold a key the same way.
+    """
+
+    def __init__(
+        self,
+        session,
+        window=KEY_BURST_WINDOW,
+        threshold=KEY_BURST_THRESHOLD,
+        hold_max=KEY_HOLD_MAX,
+        early_release_window=KEY_EARLY_RELEASE_WINDOW,
+    ):
+        self.session = session
+        self.window = window
+        self.threshold = threshold
+        self.hold_max = hold_max
+        self.early_release_window = early_release_window
+        self._recent = {}
+        self._held = {}
+        self._early_releases = {}
+
+    async def click(self, key):
+        """Send or merge one press of key; returns "sent", "held" or "merged" """
+        now = time.monotonic()
+        held = self._held.get(key)
+        if held:
+            held["deadline"] = max(held["deadline"], now + self.window)
+            return "merged"
+
+        last, count = self._recent.get(key, (0, 0))
+        count = count + 1 if now - last <= self.window else 1
+        self._recent[key] = (now, count)
+        if count < self.threshold:
+            await self.session.send_key(key)
+            return "sent"
+        del self._recent[key]
+        await self._hold(key, now + self.window)
+        return "held"
+
+    async def press(self, key):
+        """Hold key down until release() or KEY_HOLD_MAX"""
+        held = self._held.get(key)
+        if held:
+            held["deadline"] = time.monotonic() + self.hold_max
+            return "merged"
+        released = self._early_releases.pop(key, None)
+        if released is not None and time.monotonic() - released <= self.early_release_window:
+            # Its release already came in, so the key was only tapped
+            await self.session.send_key(key)
+            return "sent"
+        await self._hold(key, time.monotonic() + self.hold_max)
+        return "held"
+
+    async def release(self, key):
+        held = self._held.get(key)
+        if held:
+            held["deadline"] = 0
+            held["wake"].set()
+            await asyncio.shield(held["task"])
+        else:
+            # The press may still be on its way
+            self._early_releases[key] = time.monotonic()
+        return "released"
+
+    async def _hold(self, key, deadline):
+        held = {
+            "deadline": deadline,
+            "wake": asyncio.Event(),
+            "pressed": asyncio.get_running_loop().create_future(),
+        }
+        self._held[key] = held
+        held["task"] = asyncio.ensure_future(self._run_hold(key, held))
+        await asyncio.shield(held["pressed"])
+
+    async def _run_hold(self, key, held):
+        try:
+            await self.session.press_key(key)
+        except Exception as e:
+            self._held.pop(key, None)
+            held["pressed"].set_exception(e)
+            return
+        held["pressed"].set_result(None)
+        while (remaining := held["deadline"] - time.monotonic()) > 0:
+            held["wake"].clear()
+            with contextlib.suppress(TimeoutError):
+                await asyncio.wait_for(held["wake"].wait(), remaining)
+        # Release is only sent once the press is out, so it can never overtake it
+        self._held.pop(key, None)
+        try:
+            await self.session.release_key(key)
+        except Exception as e:
+            logger.warning("Error releasing %s: %s", key, e)
+
+
+class CommandQueue:
+    """Ordered, pipelined command delivery for one TV with per-command status
+
+    Every command gets a sequence ID and moves from "queued" to "delivered"
+    once written to the channel. Commands the TV replies to are then
+    "acknowledged" when their reply event arrives; replies carry no request
+    ID, so they are matched to the oldest command waiting on that event.
+    Failed writes are retried until the deadline, after which the command
+    is "failed". Keys the coalescer folded into a held key end up "merged",
+    as nothing of their own was written. The next command is sent without
+    waiting for earlier replies, so callers can pipeline and look the
+    outcomes up by ID.
+
+    Records are written on the event loop but read from HTTP threads too,
+    so the record table is only changed or copied under a lock.
+    """
+
+    FINAL_STATES = ("acknowledged", "delivered", "merged", "failed")
+
+    def __init__(self, session, deadline=COMMAND_DEADLINE, history=COMMAND_HISTORY):
+        self.session = session
+        self.deadline = deadline
+        self.history = history
+        self._seq = 0
+        self._records = {}
+        self._records_lock = threading.Lock()
+        self._done = {}
+        self._queue = None
+        self._worker = None
+        self._acks = {}
+        session.add_listener(self._on_event)
+
+    async def submit(self, command, send, reply_event=None, **details):
+        """Queue send() and return the new command's record"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+        self._seq += 1
+        record = {
+            "id": self._seq,
+            "tv": self.session.host,
+            "command": command,
+            **details,
+            "status": "queued",
+            "final": False,
+            "attempts": 0,
+            "error": None,
+            # Every key exists from the start, so copying a record from
+            # another thread never sees it change size
+            "result": None,
+            "created": time.time(),
+        }
+        self._done[record["id"]] = asyncio.get_running_loop().create_future()
+        with self._records_lock:
+            self._records[record["id"]] = record
+            while len(self._records) > self.history:
+                oldest = next(iter(self._records))
+                del self._records[oldest]
+                self._done.pop(oldest, None)
+        deadline = time.monotonic() + self.deadline
+        self._queue.put_nowait((record, send, reply_event, deadline))
+        return dict(record)
+
+    def close(self):
+        """Stop the worker; commands still queued are failed"""
+        if self._worker is not None:
+            self._worker.cancel()
+        while self._queue is not None and not self._queue.empty():
+            record = self._queue.get_nowait()[0]
+            self._finish(record, "failed", "Session closed")
+
+    def get(self, command_id):
+        with self._records_lock:
+            record = self._records.get(command_id)
+            return dict(record) if record else None
+
+    def recent(self):
+        with self._records_lock:
+            return [dict(record) for record in self._records.values()]
+
+    async def wait(self, command_id):
+        """Wait until the command reaches a final state and return its record"""
+        done = self._done.get(command_id)
+        if done is not None:
+            await asyncio.shield(done)
+        return self.get(command_id)
+
+    def _finish(self, record, status, error=None):
+        record["status"] = status
+        record["error"] = error
+        record["final"] = True
+        done = self._done.get(record["id"])
+        if done is not None and not done.done():
+            done.set_result(None)
+
+    async def _run(self):
+        while True:
+            record, action, reply_event, deadline = await self._queue.get()
+            if not reply_event:
+                if await self._deliver(record, action, deadline):
+                    merged = record["result"] == "merged"
+                    self._finish(record, "merged" if merged else "delivered")
+                continue
+            # Registered before sending, so a fast reply can't slip past
+            waiter = self._expect(reply_event)
+            if not await self._deliver(record, action, deadline):
+                self._forget(reply_event, waiter)
+                continue
+            # Wait for the reply off the queue so later commands go out now
+            asyncio.ensure_future(
+                self._await_ack(record, action, reply_event, deadline, waiter)
+            )
+
+    def _expect(self, reply_event):
+        waiter = asyncio.get_running_loop().create_future()
+        self._acks.setdefault(reply_event, []).append(waiter)
+        return waiter
+
+    def _forget(self, reply_event, waiter):
+        with contextlib.suppress(ValueError):
+            self._acks[reply_event].remove(waiter)
+
+    async def _deliver(self, record, action, deadline):
+        delay = COMMAND_RETRY_DELAY
+        while True:
+            record["attempts"] += 1
+            try:
+                remaining = max(0.01, deadline - time.monotonic())
+                record["result"] = await asyncio.wait_for(action(), remaining)
+                record["status"] = "delivered"
+                return True
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            if time.monotonic() + delay >= deadline:
+                self._finish(record, "failed", error)
+                return False
+            await asyncio.sleep(delay)
+            delay *= 2
+
+    async def _await_ack(self, record, action, reply_event, deadline, waiter):
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                response = await asyncio.wait_for(
+                    waiter, max(0.01, min(COMMAND_ACK_TIMEOUT, remaining))
+                )
+            except asyncio.TimeoutError:
+                self._forget(reply_event, waiter)
+                if time.monotonic() + COMMAND_ACK_TIMEOUT > deadline:
+                    # Written but never confirmed
+                    self._finish(record, "delivered", "No acknowledgement from TV")
+                    return
+                waiter = self._expect(reply_event)
+                if not await self._deliver(record, action, deadline):
+                    self._forget(reply_event, waiter)
+                    return
+                continue
+            data = response.get("data") if isinstance(response, dict) else None
+            if data in (None, 200, "200"):
+                self._finish(record, "acknowledged")
+            else:
+                self._finish(record, "failed", f"TV replied {data}")
+            return
+
+    def _on_event(self, event, response):
+        waiters = self._acks.get(event)
+        while waiters:
+            waiter = waiters.pop(0)
+            if not waiter.done():
+                waiter.set_result(response)
+                return
+
+
+class TVSession:
+    """Long-lived, authenticated remote-control WebSocket to one TV
+
+    Every coroutine runs on the shared event loop, so writes from any number
+    of HTTP handler threads are serialized by a single asyncio lock. A
+    heartbeat task pings the TV and reopens the channel with exponential
+    backoff when it goes away; if that fails it stops until the next
+    command opens the channel again.
+    """
+
+    def __init__(
+        self,
+        host,
+        port=8002,
+        identity=None,
+        token_store=None,
+        name=APP_NAME,
+        timeout=SESSION_TIMEOUT,
+        heartbeat_interval=SESSION_HEARTBEAT_INTERVAL,
+    ):
+        self.host = host
+        self.port = port
+        self.identity = identity or host
+        self.token_store = token_store or get_token_store()
+        self.name = name
+        self.timeout = timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.remote = None
+        self._lock = asyncio.Lock()
+        self._event_waiters = {}
+        self._listeners = []
+        self._http = None
+        self._heartbeat_task = None
+        self._closed = False
+        self.rate_limiter = TokenBucket()
+        self.keys = KeyCoalescer(self)
+        self.commands = CommandQueue(self)
+        # Set while a text field on the TV has its input method open
+        self.ime_active = False
+
+    def is_alive(self):
+        return self.remote is not None and self.remote.is_alive()
+
+    async def _open(self):
+        if self.is_alive():
+            return self.remote
+        await self._drop()
+
+        delay = SESSION_BACKOFF_BASE
+        from samsungtvws.async_remote import SamsungTVWSAsyncRemote
+        from samsungtvws.exceptions import UnauthorizedError
+
+        for attempt in range(SESSION_RECONNECT_ATTEMPTS):
+            token = self.token_store.get(self.identity)
+            remote = SamsungTVWSAsyncRemote(
+                self.host,
+                port=self.port,
+                token=token,
+                timeout=self.timeout,
+                # The library sleeps this long after every frame by default
+                key_press_delay=0,
+                name=self.name,
+            )
+            try:
+                with metrics.track(TV_CONNECT_SECONDS, TV_CONNECTS, tv=self.host):
+                    await remote.start_listening(self._on_event)
+            except UnauthorizedError:
+                raise
+            except Exception as e:
+                if attempt == SESSION_RECONNECT_ATTEMPTS - 1:
+                    raise
+                logger.warning("Error connecting to %s: %s, retrying in %ss", self.host, e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, SESSION_BACKOFF_MAX)
+                continue
+            if remote.token and (
+                remote.token != token or not self.token_store.has_token(self.identity)
+            ):
+                # Remember the pairing so reconnects skip the approval prompt;
+                # this also moves an accepted tv-token.txt token to this TV
+                self.token_store.set(self.identity, remote.token)
+            self.remote = remote
+            remote._recv_loop.add_done_callback(
+                lambda _, closed=remote: self._on_channel_closed(closed)
+            )
+            if self._heartbeat_task is None or self._heartbeat_task.done():
+                self._heartbeat_task = asyncio.ensure_future(self._heartbeat())
+            self._notify("session.open", {})
+            return remote
+
+    async def _drop(self):
+        remote, self.remote = self.remote, None
+        self.ime_active = False
+        if remote is not None:
+            with contextlib.suppress(Exception):
+                await remote.close()
+
+    async def _heartbeat(self):
+        while not self._closed:
+            await asyncio.sleep(self.heartbeat_interval)
+            remote = self.remote
+            try:
+                if remote is not None and remote.is_alive():
+                    pong = await remote.connection.ping()
+                    await asyncio.wait_for(pong, SESSION_HEARTBEAT_TIMEOUT)
+                    continue
+            except Exception:
+                pass
+            # The channel died while idle; reopen it before the next key press
+            if not await self._reconnect():
+                return
+
+    def _on_channel_closed(self, remote):
+        # Channels we close ourselves are detached from self.remote first
+        if remote is not self.remote or self._closed:
+            return
+        self.remote = None
+        self.ime_active = False
+        self._notify("session.closed", {})
+        asyncio.ensure_future(self._reconnect())
+
+    async def _reconnect(self):
+        """Reopen a dropped channel; returns whether it is open"""
+        async with self._lock:
+            if self._closed:
+                return False
+            if self.is_alive():
+                return True
+            try:
+                await self._open()
+            except Exception as e:
+                logger.warning("Error reconnecting to %s: %s", self.host, e)
+                # The TV is off or gone. Stop pinging until a command reopens
+                # the channel, which starts the heartbeat again.
+                heartbeat = self._heartbeat_task
+                if heartbeat is not None and heartbeat is not asyncio.current_task():
+                    heartbeat.cancel()
+                return False
+            return True
+
+    def add_listener(self, callback):
+        """Call callback(event, response) for every channel event
+
+        Besides the TV's own events, "session.open" and "session.closed"
+        are reported when the channel comes up or drops.
+        """
+        if callback not in self._listeners:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with contextlib.suppress(ValueError):
+            self._listeners.remove(callback)
+
+    def _notify(self, event, response):
+        for callback in list(self._listeners):
+            try:
+                callback(event, response)
+            except Exception as e:
+                logger.warning("Error in TV event listener: %s", e)
+
+    def _on_event(self, event, response):
+        if event == "ms.remote.imeStart":
+            self.ime_active = True
+        elif event == "ms.remote.imeEnd":
+            self.ime_active = False
+        for future in self._event_waiters.pop(event, []):
+            if not future.done():
+                future.set_result(response)
+        self._notify(event, response)
+
+    async def request(self, command, reply_event, timeout=None):
+        """Send a command and wait for the TV's reply event"""
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._event_waiters.setdefault(reply_event, [])
+        waiters.append(future)
+        try:
+            await self.send(command)
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        finally:
+            with contextlib.suppress(ValueError):
+                self._event_waiters.get(reply_event, []).remove(future)
+
+    async def connect(self):
+        """Open the channel if it is not already open"""
+        async with self._lock:
+            await self._open()
+
+    async def send(self, command):
+        """Write a single command frame, reopening the channel once if needed"""
+        async with self._lock:
+            remote = await self._open()
+            try:
+                await remote.send_command(command, key_press_delay=0)
+            except Exception:
+                await self._drop()
+                remote = await self._open()
+                await remote.send_command(command, key_press_delay=0)
+
+    def _track(self, command):
+        return metrics.track(TV_COMMAND_SECONDS, TV_COMMANDS, tv=self.host, command=command)
+
+    async def send_key(self, key):
+        await self.rate_limiter.acquire()
+        with self._track("key"):
+            from samsungtvws.remote import SendRemoteKey
+
+            await self.send(SendRemoteKey.click(key))
+
+    async def send_text(self, text):
+        """Replace the focused text field's contents with text in one frame"""
+        await self.rate_limiter.acquire()
+        with self._track("text"):
+            from samsungtvws.remote import RemoteControlCommand
+
+            await self.send(
+                RemoteControlCommand(
+                    {
+                        "Cmd": base64.b64encode(text.encode()).decode(),
+                        "DataOfCmd": "base64",
+                        "TypeOfRemote": "SendInputString",
+                    }
+                )
+            )
+
+    async def wake(self, mac, timeout=WAKE_TIMEOUT):
+        """Power the TV on with Wake-on-LAN and return once keys can be sent
+
+        Magic packets are repeated until the REST API reports the TV as on,
+        then the remote channel is opened so the first key goes straight
+        out. Returns the seconds this took.
+        """
+        from wakeonlan import send_magic_packet
+
+        started = time.monotonic()
+        next_packet = started
+        while not await self._is_awake():
+            now = time.monotonic()
+            if now - started > timeout:
+                raise TimeoutError(f"{self.host} did not wake within {timeout}s")
+            if now >= next_packet:
+                send_magic_packet(mac)
+                # Also unicast, for networks that drop broadcasts
+                with contextlib.suppress(OSError):
+                    send_magic_packet(mac, ip_address=self.host)
+                next_packet = now + WAKE_PACKET_INTERVAL
+            await asyncio.sleep(WAKE_POLL_INTERVAL)
+        await self.connect()
+        elapsed = time.monotonic() - started
+        TV_WAKE_SECONDS.observe(elapsed, tv=self.host)
+        return elapsed
+
+    async def _is_awake(self):
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), WAKE_PROBE_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        with contextlib.suppress(OSError):
+            await writer.wait_closed()
+        # With network standby the REST API answers while the screen is off
+        try:
+            info = await asyncio.wait_for(self.device_info(), WAKE_INFO_TIMEOUT)
+        except Exception:
+            return False
+        return info.get("device", {}).get("PowerState", "on") == "on"
+
+    async def press_key(self, key):
+        await self.rate_limiter.acquire()
+        with self._track("key_press"):
+            from samsungtvws.remote import SendRemoteKey
+
+            await self.send(SendRemoteKey.press(key))
+
+    async def release_key(self, key):
+        # Never rate limited, or a held key could outlive its release
+        with self._track("key_release"):
+            from samsungtvws.remote import SendRemoteKey
+
+            await self.send(SendRemoteKey.release(key))
+
+    async def send_keys(self, steps):
+        """Send (key, delay) steps back to back and report each outcome
+
+        Stops at the first failure; the remaining steps are reported as
+        skipped rather than each retrying a dead connection.
+        """
+        results = []
+        failed = False
+        for key, delay in steps:
+            if failed:
+                results.append({"key": key, "success": False, "message": "Skipped"})
+                continue
+            try:
+                await self.send_key(key)
+                results.append({"key": key, "success": True, "message": "Sent"})
+            except Exception as e:
+                failed = True
+                results.append({"key": key, "success": False, "message": str(e)})
+                continue
+            if delay:
+                await asyncio.sleep(delay)
+        return results
+
+    async def run_app(self, app_id, app_type="DEEP_LINK", meta_tag=""):
+        from samsungtvws.remote import ChannelEmitCommand
+
+        with self._track("launch"):
+            await self.send(ChannelEmitCommand.launch_app(app_id, app_type, meta_tag))
+
+    async def app_list(self):
+        async with self._lock:
+            remote = await self._open()
+        # Waiting for the reply must not hold up key presses
+        with self._track("app_list"):
+            return await remote.app_list()
+
+    async def app_icon(self, icon_path):
+        """Fetch an app icon as PNG bytes over the channel"""
+        from samsungtvws.remote import ChannelEmitCommand
+
+        with self._track("app_icon"):
+            response = await self.request(
+                ChannelEmitCommand(
+                    {"event": "ed.apps.icon", "to": "host", "data": {"iconPath": icon_path}}
+                ),
+                "ed.apps.icon",
+                APP_ICON_TIMEOUT,
+            )
+        return base64.b64decode(response.get("data", {}).get("imageBase64", ""))
+
+    def _http_session(self):
+        if self._http is None or self._http.closed:
+            import aiohttp
+
+            self._http = aiohttp.ClientSession()
+        return self._http
+
+    async def device_info(self):
+        from samsungtvws.async_rest import SamsungTVAsyncRest
+
+        rest = SamsungTVAsyncRest(
+            self.host, session=self._http_session(), port=self.port, timeout=self.timeout
+        )
+        with self._track("device_info"):
+            return await rest.rest_device_info()
+
+    async def _rendering_control(self, action, result_tag):
+        import aiohttp
+
+        # Volume isn't exposed on the WebSocket API, only over UPnP
+        body = (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<s:Envelope xmlns:s="http://schemas.xmlsoap.org/soap/envelope/" '
+            's:encodingStyle="http://schemas.xmlsoap.org/soap/encoding/"><s:Body>'
+            f'<u:{action} xmlns:u="urn:schemas-upnp-org:service:RenderingControl:1">'
+            "<InstanceID>0</InstanceID><Channel>Master</Channel>"
+            f"</u:{action}></s:Body></s:Envelope>"
+        )
+        headers = {
+            "Content-Type": 'text/xml; charset="utf-8"',
+            "SOAPACTION": f'"urn:schemas-upnp-org:service:RenderingControl:1#{action}"',
+        }
+        url = f"http://{self.host}:{UPNP_PORT}/upnp/control/RenderingControl1"
+        async with self._http_session().post(
+            url,
+            data=body,
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=UPNP_TIMEOUT),
+        ) as response:
+            text = await response.text()
+        match = re.search(f"<{result_tag}>(.*?)</{result_tag}>", text)
+        return match.group(1) if match else None
+
+    async def volume(self):
+        """Return (volume, muted) as reported by the TV's UPnP renderer"""
+        with self._track("volume"):
+            volume, muted = await asyncio.gather(
+                self._rendering_control("GetVolume", "CurrentVolume"),
+                self._rendering_control("GetMute", "CurrentMute"),
+            )
+        return (
+            int(volume) if volume is not None else None,
+            muted == "1" if muted is not None else None,
+        )
+
+    async def close(self):
+        self._closed = True
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        self.commands.close()
+        async with self._lock:
+            await self._drop()
+        if self._http is not None:
+            await self._http.close()
+
+
+class SessionPool:
+    """Hand out one shared TVSession per TV"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def get(self, host, port=8002, identity=None):
+        with self._lock:
+            session = self._sessions.get((host, port))
+            if session is None or session._closed:
+                session = TVSession(host, port=port, identity=identity)
+                self._sessions[(host, port)] = session
+            elif identity:
+                session.identity = identity
+            return session
+
+    async def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        await asyncio.gather(*(s.close() for s in sessions), return_exceptions=True)
+
+
+_session_pools = weakref.WeakKeyDictionary()
+_session_pools_lock = threading.Lock()
+
+
+def get_session_pool():
+    """Return the TV session pool for the calling event loop
+
+    Sessions hold sockets and locks bound to one loop, so each loop gets
+    its own pool; code outside any loop gets the background loop's pool.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = get_event_loop_thread().loop
+    with _session_pools_lock:
+        pool = _session_pools.get(loop)
+        if pool is None:
+            pool = _session_pools[loop] = SessionPool()
+        return pool
+
+
+def _netlink_ipv4_addresses():
+    """Yield (interface index, prefix length, address) from an RTM_GETADDR dump"""
+    NLMSG_ERROR, NLMSG_DONE, RTM_NEWADDR, RTM_GETADDR = 2, 3, 20, 22
+    NLM_F_REQUEST, NLM_F_DUMP = 0x1, 0x300
+    IFA_ADDRESS, IFA_LOCAL = 1, 2
+    with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE) as sock:
+        sock.settimeout(1)
+        request = struct.pack("=BBBBI", socket.AF_INET, 0, 0, 0, 0)
+        header = struct.pack(
+            "=IHHII", 16 + len(request), RTM_GETADDR, NLM_F_REQUEST | NLM_F_DUMP, 1, 0
+        )
+        sock.send(header + request)
+        while True:
+            data = sock.recv(65536)
+            offset = 0
+            while offset + 16 <= len(data):
+                length, kind = struct.unpack_from("=IH", data, offset)
+                if kind in (NLMSG_DONE, NLMSG_ERROR) or length < 16:
+                    return
+                if kind == RTM_NEWADDR:
+                    _, prefix, _, _, index = struct.unpack_from("=BBBBI", data, offset + 16)
+                    attrs = {}
+                    position = offset + 24
+                    while position + 4 <= offset + length:
+                        attr_length, attr_type = struct.unpack_from("=HH", data, position)
+                        if attr_length < 4:
+                            break
+                        attrs[attr_type] = data[position + 4 : position + attr_length]
+                        position += (attr_length + 3) & ~3
+                    # IFA_ADDRESS is the peer on point-to-point links
+                    address = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+                    if address and len(address) == 4:
+                        yield index, prefix, socket.inet_ntoa(address)
+                offset += (length + 3) & ~3
+
+
+def local_ipv4_interfaces():
+    """Return an IPv4Interface for every address on an attached network
+
+    Addresses come from the kernel over netlink, so every interface and
+    its real netmask is covered. Loopback and link-local addresses are
+    skipped. Returns [] where netlink is unavailable (non-Linux hosts).
+    """
+    if not hasattr(socket, "AF_NETLINK"):
+        return []
+    interfaces = []
+    try:
+        for _, prefix, address in _netlink_ipv4_addresses():
+            interface = ipaddress.IPv4Interface(f"{address}/{prefix}")
+            if not (interface.ip.is_loopback or interface.ip.is_link_local):
+                interfaces.append(interface)
+    except OSError as e:
+        logger.warning("Error listing network interfaces: %s", e)
+    return interfaces
+
+
+def read_neighbor_table(path=NEIGHBOR_TABLE_FILE):
+    """Return {ip: mac} for every resolved host in the kernel's ARP table
+
+    Read from /proc/net/arp, or from `ip neigh` where that file is not
+    available.
+    """
+    neighbors = {}
+    try:
+        with open(path, "r") as f:
+            next(f, None)
+            for line in f:
+                fields = line.split()
+                # Flags 0x0 is an unanswered lookup, with an all-zero MAC
+                if len(fields) >= 4 and fields[2] != "0x0":
+                    neighbors[fields[0]] = fields[3].lower()
+        return neighbors
+    except OSError:
+        pass
+    try:
+        output = subprocess.run(
+            ["ip", "-4", "neigh", "show"],
+            capture_output=True,
+            text=True,
+            timeout=NEIGHBOR_COMMAND_TIMEOUT,
+        ).stdout
+    except (OSError, subprocess.SubprocessError):
+        return neighbors
+    for line in output.splitlines():
+        # 192.168.1.20 dev eth0 lladdr 8c:79:f5:12:34:56 REACHABLE
+        fields = line.split()
+        if "lladdr" in fields and fields.index("lladdr") + 1 < len(fields):
+            neighbors[fields[0]] = fields[fields.index("lladdr") + 1].lower()
+    return neighbors
+
+
+_samsung_ouis = None
+
+
+def is_samsung_mac(mac):
+    """Return True if mac starts with one of Samsung's OUIs"""
+    global _samsung_ouis
+    if _samsung_ouis is None:
+        ouis = set()
+        try:
+            with open(SAMSUNG_OUI_FILE, "r") as f:
+                ouis = {line.strip() for line in f if line.strip() and not line.startswith("#")}
+        except OSError as e:
+            logger.warning("Error loading Samsung OUI table: %s", e)
+        _samsung_ouis = frozenset(ouis)
+    return re.sub(r"[^0-9a-f]", "", mac.lower())[:6] in _samsung_ouis
+
+
+def plan_scan(networks, known=(), neighbors=None):
+    """Split the hosts of networks into stages, likeliest TVs first
+
+    Returns [candidates, neighbors, rest]: previously seen TVs and hosts
+    in the neighbor table with a Samsung MAC, then the other hosts in the
+    neighbor table, then every other host of the networks. Known hosts
+    are kept even when outside the networks.
+    """
+    networks = [ipaddress.IPv4Network(network, strict=False) for network in networks]
+    neighbors = neighbors or {}
+    candidates = list(dict.fromkeys(known))
+    queued = set(candidates)
+    others = []
+    for ip, mac in neighbors.items():
+        if ip in queued or not any(ipaddress.IPv4Address(ip) in net for net in networks):
+            continue
+        (candidates if is_samsung_mac(mac) else others).append(ip)
+        queued.add(ip)
+    rest = []
+    for network in networks:
+        for address in network.hosts():
+            ip = str(address)
+            if ip not in queued:
+                rest.append(ip)
+                queued.add(ip)
+    return [candidates, others, rest]
+
+
+class NetworkScanner:
+    """Asyncio sweep that finds Samsung TVs with non-blocking TCP probes"""
+
+    def __init__(
+        self,
+        ports=SCAN_PORTS,
+        concurrency=SCAN_CONCURRENCY,
+        probe_timeout=SCAN_PROBE_TIMEOUT,
+        info_timeout=SCAN_INFO_TIMEOUT,
+    ):
+        self.ports = tuple(ports)
+        self.concurrency = concurrency
+        self.probe_timeout = probe_timeout
+        self.info_timeout = info_timeout
+
+    async def probe_port(self, ip, port):
+        """Return True if a TCP connection to ip:port succeeds in time"""
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(ip, port), self.probe_timeout
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False
+        writer.close()
+        with contextlib.suppress(OSError):
+            await writer.wait_closed()
+        return True
+
+    async def find_open_port(self, ip):
+        """Probe all Samsung ports at once and return the first open one"""
+        results = await asyncio.gather(*(self.probe_port(ip, p) for p in self.ports))
+        for port, is_open in zip(self.ports, results):
+            if is_open:
+                return port
+        return None
+
+    async def probe_host(self, session, ip):
+        """Return a TV record if ip is a Samsung TV, else None"""
+        started = time.perf_counter()
+        tv = await self._identify_host(session, ip)
+        SCAN_PROBE_SECONDS.observe(
+            time.perf_counter() - started, result="tv" if tv else "none"
+        )
+        return tv
+
+    async def _identify_host(self, session, ip):
+        port = await self.find_open_port(ip)
+        if port is None:
+            return None
+        from samsungtvws.async_rest import SamsungTVAsyncRest
+
+        # Only hosts with an open port are worth a REST round trip
+        try:
+            rest = SamsungTVAsyncRest(
+                ip, session=session, port=port, timeout=self.info_timeout
+            )
+            info = await asyncio.wait_for(rest.rest_device_info(), self.info_timeout)
+        except Exception:
+            return None
+        if info and "name" in info:
+            device = info.get("device", {})
+            return {
+                "ip": ip,
+                "name": info.get("name", "Samsung TV"),
+                "mac": device.get("wifiMac", ""),
+                "model": device.get("modelName", ""),
+            }
+        return None
+
+    async def check_host(self, ip):
+        """Probe a single host with its own HTTP session"""
+        import aiohttp
+
+        async with aiohttp.ClientSession() as session:
+            return await self.probe_host(session, ip)
+
+    async def scan(self, hosts, on_found=None, timeout=SCAN_TIMEOUT):
+        """Probe hosts concurrently and return every TV found before timeout"""
+        import aiohttp
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        found_tvs = []
+
+        async def bounded_probe(session, ip):
+            async with semaphore:
+                return await self.probe_host(session, ip)
+
+        async with aiohttp.ClientSession() as session:
+            tasks = [
+                asyncio.ensure_future(bounded_probe(session, ip)) for ip in hosts
+            ]
+            try:
+                for next_done in asyncio.as_completed(tasks, timeout=timeout):
+                    tv = await next_done
+                    if tv:
+                        found_tvs.append(tv)
+                        if on_found:
+                            on_found(tv)
+            except asyncio.TimeoutError:
+                logger.warning("Scan timed out after %ss", timeout)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        return found_tvs
+
+
+class _DatagramCollector(asyncio.DatagramProtocol):
+    """Hand every received datagram to a callback"""
+
+    def __init__(self, on_datagram):
+        self.on_datagram = on_datagram
+
+    def datagram_received(self, data, addr):
+        self.on_datagram(data, addr[0])
+
+
+class PassiveDiscovery:
+    """Find Samsung TVs from SSDP M-SEARCH and mDNS replies instead of a sweep"""
+
+    def __init__(
+        self,
+        listen_timeout=DISCOVERY_LISTEN_TIMEOUT,
+        ssdp_address=SSDP_ADDRESS,
+        mdns_address=MDNS_ADDRESS,
+        scanner=None,
+    ):
+        self.listen_timeout = listen_timeout
+        self.ssdp_address = ssdp_address
+        self.mdns_address = mdns_address
+        self.scanner = scanner or NetworkScanner()
+
+    @staticmethod
+    def build_msearch(search_target):
+        """Build an SSDP M-SEARCH request for one search target"""
+        return (
+            "M-SEARCH * HTTP/1.1\r\n"
+            f"HOST: {SSDP_ADDRESS[0]}:{SSDP_ADDRESS[1]}\r\n"
+            'MAN: "ssdp:discover"\r\n'
+            "MX: 1\r\n"
+            f"ST: {search_target}\r\n"
+            "\r\n"
+        ).encode()
+
+    @staticmethod
+    def build_mdns_query(service=MDNS_SERVICE):
+        """Build an mDNS PTR query asking for unicast replies"""
+        header = struct.pack("!HHHHHH", 0, 0, 1, 0, 0, 0)
+        name = b"".join(
+            bytes([len(label)]) + label.encode() for label in service.split(".")
+        )
+        # QTYPE PTR, QCLASS IN with the unicast-response bit set
+        return header + name + b"\x00" + struct.pack("!HH", 12, 0x8001)
+
+    @staticmethod
+    def is_samsung_reply(data):
+        """Cheaply tell Samsung SSDP/mDNS replies apart from other chatter"""
+        if data.startswith(b"M-SEARCH"):
+            return False
+        if len(data) >= 12 and struct.unpack("!H", data[2:4])[0] & 0x8000:
+            return b"_samsungmsf" in data
+        return b"samsung" in data.lower()
+
+    async def discover(self, on_found=None):
+        """Multicast one round of queries and return every TV that replies"""
+        import aiohttp
+
+        loop = asyncio.get_running_loop()
+        found_tvs = []
+        seen = set()
+        confirmations = []
+
+        async with aiohttp.ClientSession() as session:
+
+            async def confirm(ip):
+                tv = await self.scanner.probe_host(session, ip)
+                if tv:
+                    found_tvs.append(tv)
+                    if on_found:
+                        on_found(tv)
+
+            def on_datagram(data, ip):
+                if ip in seen or not self.is_samsung_reply(data):
+                    return
+                seen.add(ip)
+                confirmations.append(asyncio.ensure_future(confirm(ip)))
+
+            try:
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda: _DatagramCollector(on_datagram),
+                    local_addr=("0.0.0.0", 0),
+                    family=socket.AF_INET,
+                )
+            except OSError as e:
+                logger.warning("Passive discovery unavailable: %s", e)
+                return found_tvs
+
+            try:
+                sock = transport.get_extra_info("socket")
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+                for target in SSDP_SEARCH_TARGETS:
+                    transport.sendto(self.build_msearch(target), self.ssdp_address)
+                transport.sendto(self.build_mdns_query(), self.mdns_address)
+                await asyncio.sleep(self.listen_timeout)
+            except OSError as e:
+                logger.warning("Passive discovery failed: %s", e)
+            finally:
+                transport.close()
+
+            if confirmations:
+                await asyncio.gather(*confirmations, return_exceptions=True)
+
+        return found_tvs
+
+
+async def discover_tvs(mode, hosts, on_found=None):
+    """Run passive, active or hybrid discovery and report each TV once"""
+    found_tvs = []
+    seen = set()
+
+    def report(tv):
+        if tv["ip"] in seen:
+            return
+        seen.add(tv["ip"])
+        found_tvs.append(tv)
+        if on_found:
+            on_found(tv)
+
+    backends = []
+    if mode in ("passive", "hybrid"):
+        backends.append(PassiveDiscovery().discover(on_found=report))
+    if mode in ("active", "hybrid"):
+        backends.append(NetworkScanner().scan(hosts, on_found=report))
+    await asyncio.gather(*backends)
+    return found_tvs
+
+
+class DiscoveryCache:
+    """Disk-backed record of discovered TVs with a freshness TTL"""
+
+    def __init__(
+        self, path, ttl=DISCOVERY_CACHE_TTL, max_age=DISCOVERY_CACHE_MAX_AGE
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_age = max_age
+        self._store = JSONStore(path, entry_keys={"tvs": "ip"})
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Rebuilt from the store each time to pick up other processes' entries
+        self._entries = {entry["ip"]: entry for entry in self._store.get("tvs", [])}
+
+    def _save(self):
+        # Debounced, so a scan that finds many TVs is written once
+        self._store.set("tvs", list(self._entries.values()))
+
+    def _evict(self, now):
+        expired = [
+            ip
+            for ip, entry in self._entries.items()
+            if now - entry.get("last_seen", 0) > self.max_age
+        ]
+        for ip in expired:
+            del self._entries[ip]
+        return bool(expired)
+
+    def entries(self):
+        """Return every cached TV, dropping ones not seen within max_age"""
+        with self._lock:
+            self._load()
+            if self._evict(time.time()):
+                self._save()
+            return [dict(entry) for entry in self._entries.values()]
+
+    def split_fresh(self):
+        """Return (fresh, stale) cached TVs according to the TTL"""
+        now = time.time()
+        fresh, stale = [], []
+        for entry in self.entries():
+            if now - entry.get("last_seen", 0) <= self.ttl:
+                fresh.append(entry)
+            else:
+                stale.append(entry)
+        return fresh, stale
+
+    def update(self, tv):
+        """Record that a TV was just seen"""
+        with self._lock:
+            self._load()
+            mac = tv.get("mac")
+            if mac:
+                # A TV that moved to a new DHCP lease replaces its old entry
+                for ip, entry in list(self._entries.items()):
+                    if entry.get("mac") == mac and ip != tv["ip"]:
+                        del self._entries[ip]
+            self._entries[tv["ip"]] = dict(tv, last_seen=time.time())
+            self._save()
+
+
+class AppCatalog:
+    """Per-TV cache of installed apps with a TTL, an ETag and on-disk icons
+
+    With directory=None app lists are kept in memory and icons aren't
+    fetched.
+    """
+
+    def __init__(self, directory, ttl=APP_CACHE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._catalogs = {}
+        self._refreshing = {}
+        self._lock = threading.Lock()
+
+    def _tv_dir(self, tv_id):
+        return os.path.join(self.directory, tv_id.replace(":", "_"))
+
+    def _load(self, tv_id):
+        # One store per TV, opened the first time that TV is asked about
+        catalog = self._catalogs.get(tv_id)
+        if catalog is None:
+            path = self.directory and os.path.join(self._tv_dir(tv_id), "apps.json")
+            catalog = self._catalogs[tv_id] = JSONStore(path)
+        return catalog
+
+    @staticmethod
+    def _etag(apps):
+        digest = hashlib.sha1(json.dumps(apps, sort_keys=True).encode()).hexdigest()
+        return f'"{digest}"'
+
+    def get(self, tv_id):
+        """Return (apps, etag, is_fresh), or (None, None, False) if not cached"""
+        with self._lock:
+            catalog = self._load(tv_id)
+            if catalog.get("apps") is None:
+                return None, None, False
+            is_fresh = time.time() - catalog.get("fetched", 0) <= self.ttl
+            apps = self._with_icons(tv_id, catalog.get("apps"))
+            # Hash what is served so newly fetched icons change the ETag too
+            return apps, self._etag(apps), is_fresh
+
+    def _with_icons(self, tv_id, apps):
+        result = []
+        for app in apps:
+            app = dict(app)
+            app_id = app.get("appId", "")
+            if self.icon_path(tv_id, app_id):
+                app["icon_url"] = f"/api/apps/icon?app_id={app_id}"
+            result.append(app)
+        return result
+
+    def icon_path(self, tv_id, app_id):
+        """Return the cached icon file for an app, or None"""
+        if not self.directory or not app_id or os.sep in app_id or "/" in app_id:
+            return None
+        path = os.path.join(self._tv_dir(tv_id), f"{app_id}.png")
+        return path if os.path.exists(path) else None
+
+    def store(self, tv_id, apps):
+        with self._lock:
+            try:
+                if self.directory:
+                    os.makedirs(self._tv_dir(tv_id), exist_ok=True)
+            except OSError as e:
+                logger.warning("Error saving app cache: %s", e)
+            self._load(tv_id).update({"apps": apps, "fetched": time.time()})
+
+    async def refresh(self, tv_id, session):
+        """Re-read the app list from the TV and fetch any icons we lack"""
+        apps = await session.app_list()
+        if apps is None:
+            raise TimeoutError("TV did not return an app list")
+        self.store(tv_id, apps)
+        if not self.directory:
+            return apps
+
+        tv_dir = self._tv_dir(tv_id)
+        for app in apps:
+            app_id, icon = app.get("appId"), app.get("icon")
+            if not app_id or not icon or self.icon_path(tv_id, app_id):
+                continue
+            try:
+                data = await session.app_icon(icon)
+            except Exception as e:
+                logger.warning("Error fetching icon for %s: %s", app_id, e)
+                continue
+            if data:
+                with open(os.path.join(tv_dir, f"{app_id}.png"), "wb") as f:
+                    f.write(data)
+        return apps
+
+    def refresh_in_background(self, tv_id, session):
+        """Start a refresh unless one is already running for this TV"""
+        with self._lock:
+            future = self._refreshing.get(tv_id)
+            if future is not None and not future.done():
+                return future
+            try:
+                asyncio.get_running_loop()
+                future = asyncio.ensure_future(self.refresh(tv_id, session))
+            except RuntimeError:
+                future = get_event_loop_thread().submit(self.refresh(tv_id, session))
+            self._refreshing[tv_id] = future
+
+        def report(done):
+            if not done.cancelled() and done.exception():
+                logger.warning("Error refreshing apps: %s", done.exception())
+
+        future.add_done_callback(report)
+        return future
+
+
+class StatusBroadcaster:
+    """Fan status snapshots out to every subscribed event-stream client
+
+    Each open stream holds an HTTP worker, so the number of subscribers is
+    capped below the worker pool size.
+    """
+
+    def __init__(self, max_subscribers=EVENT_STREAM_MAX_CLIENTS):
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._last = None
+
+    def subscribe(self):
+        """Return a queue of status snapshots, or None if the cap is reached"""
+        subscriber = queue.Queue()
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def publish(self, status):
+        with self._lock:
+            if status == self._last:
+                return
+            self._last = status
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.put(status)
+
+    def close(self):
+        """Tell every subscriber to stop"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for subscriber in subscribers:
+            subscriber.put(None)
+
+
+class TVFleet:
+    """Registry of many TVs with group targeting and parallel fan-out
+
+    Each TV gets its own pooled session and stored token. Commands for a group
+    run concurrently on the shared event loop, so acting on N TVs takes
+    about one round trip rather than N.
+    """
+
+    def __init__(self, path, concurrency=FLEET_CONCURRENCY):
+        self.path = path
+        self.concurrency = concurrency
+        self._store = JSONStore(path, entry_keys={"tvs": "id"})
+        self._tvs = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        # Rebuilt from the store each time to pick up other processes' entries
+        self._tvs = {tv["id"]: tv for tv in self._store.get("tvs", [])}
+
+    def _save(self):
+        self._store.set("tvs", list(self._tvs.values()))
+
+    def list(self):
+        with self._lock:
+            self._load()
+            return [dict(tv) for tv in self._tvs.values()]
+
+    def register(self, ip, name=None, room="", tags=(), port=8002):
+        """Add or update a TV, reading its name and MAC from the REST API
+
+        A TV that doesn't answer within FLEET_VERIFY_TIMEOUT is stored under
+        its IP with "verified" false, and moved to its real identity the
+        first time a fleet command reaches it.
+        """
+        info = get_event_loop_thread().run(self._device_info(ip, port))
+        tv = {
+            "id": tv_identity(info, ip),
+            "ip": ip,
+            "port": port,
+            "name": name or info.get("name", "Samsung TV"),
+            "mac": info.get("device", {}).get("wifiMac", ""),
+            "room": room,
+            "tags": sorted(set(tags)),
+            "verified": bool(info),
+        }
+        with self._lock:
+            self._load()
+            self._put(tv)
+        return dict(tv)
+
+    async def _device_info(self, ip, port):
+        session = TVSession(ip, port=port)
+        try:
+            return await asyncio.wait_for(session.device_info(), FLEET_VERIFY_TIMEOUT)
+        except Exception as e:
+            logger.warning("Could not read device info from %s: %s", ip, e)
+            return {}
+        finally:
+            await session.close()
+
+    def _put(self, tv):
+        # An unverified entry for the same address is the same TV
+        for other in list(self._tvs.values()):
+            unverified = not other.get("verified", True)
+            if unverified and other["ip"] == tv["ip"] and other["id"] != tv["id"]:
+                del self._tvs[other["id"]]
+        self._tvs[tv["id"]] = tv
+        self._save()
+
+    async def _verify(self, tv):
+        """Identify an unverified TV; returns the updated entry, or tv if still unreachable"""
+        info = await self._device_info(tv["ip"], tv["port"])
+        if not info:
+            return tv
+        verified = dict(
+            tv,
+            id=tv_identity(info, tv["ip"]),
+            # Only replaces the placeholder, not a name given at registration
+            name=info.get("name", tv["name"]) if tv["name"] == "Samsung TV" else tv["name"],
+            mac=info.get("device", {}).get("wifiMac", ""),
+            verified=True,
+        )
+        with self._lock:
+            self._load()
+            # Registered again since, possibly under its real identity
+            if self._tvs.get(tv["id"]) == tv:
+                self._put(verified)
+        return verified
+
+    def remove(self, tv_id):
+        with self._lock:
+            self._load()
+            tv = self._tvs.pop(tv_id, None)
+            if tv is not None:
+                self._save()
+        return tv is not None
+
+    def select(self, target):
+        """Resolve {"all"}, {"ids"}, {"tag"} or {"room"} to a list of TVs"""
+        if not isinstance(target, dict):
+            raise ValueError("Target must be an object with all, ids, tag or room")
+        tvs = self.list()
+        if target.get("all"):
+            return tvs
+        if "ids" in target:
+            ids = target["ids"]
+            if not isinstance(ids, list) or not all(isinstance(i, str) for i in ids):
+                raise ValueError("Target ids must be a list of strings")
+            ids = set(ids)
+            return [tv for tv in tvs if tv["id"] in ids]
+        for field in ("tag", "room"):
+            if field in target and not isinstance(target[field], str):
+                raise ValueError(f"Target {field} must be a string")
+        if "tag" in target:
+            return [tv for tv in tvs if target["tag"] in tv["tags"]]
+        if "room" in target:
+            return [tv for tv in tvs if tv["room"] == target["room"]]
+        raise ValueError("Target must be one of all, ids, tag or room")
+
+    def session(self, tv):
+        return get_session_pool().get(tv["ip"], port=tv["port"], identity=tv["id"])
+
+    async def fan_out(self, tvs, action, timeout=COMMAND_TIMEOUT):
+        """Run action(session, tv) on every TV at once and collect per-TV results"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_one(tv):
+            started = time.monotonic()
+            tv_id = tv["id"]
+            async with semaphore:
+                try:
+                    if not tv.get("verified", True):
+                        tv = await self._verify(tv)
+                    await asyncio.wait_for(action(self.session(tv), tv), timeout)
+                    success, message = True, "OK"
+                except asyncio.TimeoutError:
+                    success, message = False, "Timed out"
+                except Exception as e:
+                    success, message = False, str(e)
+            return tv_id, {
+                "success": success,
+                "message": message,
+                "elapsed": round(time.monotonic() - started, 3),
+            }
+
+        return dict(await asyncio.gather(*(run_one(tv) for tv in tvs)))
+
+    def run(self, target, action, timeout=COMMAND_TIMEOUT):
+        """Fan an action out to the targeted TVs and aggregate the results"""
+        tvs = self.select(target)
+        if not tvs:
+            return False, "No TVs matched the target", {}
+        results = get_event_loop_thread().run(self.fan_out(tvs, action, timeout))
+        succeeded = sum(1 for result in results.values() if result["success"])
+        return succeeded == len(tvs), f"{succeeded}/{len(tvs)} TVs succeeded", results
+
+    def connect(self, target):
+        return self.run(target, lambda session, tv: session.connect())
+
+    def send_key(self, target, key):
+        return self.run(target, lambda session, tv: session.send_key(key))
+
+    def launch_app(self, target, app_id):
+        return self.run(target, lambda session, tv: session.run_app(app_id))
+
+    def power_on(self, target):
+        async def wake(session, tv):
+            if not tv["mac"]:
+                raise ValueError("MAC address unknown")
+            await session.wake(tv["mac"])
+
+        return self.run(target, wake, WAKE_TIMEOUT)
+
+
+class AsyncSamsungTVRemote:
+    """Awaitable TV remote for embedding in an asyncio application
+
+    Every method that talks to a TV is a coroutine and can be cancelled.
+    Sessions come from the pool of the running event loop, so any number of
+    instances on one loop share one connection per TV. Pass config_file=None
+    to keep the remembered TV, fleet, discovery cache and app lists in
+    memory only.
+    """
+
+    def __init__(self, config_file="tv_config.json"):
         self.tv = None
         self.connected = False
-        self.config_file = "tv_config.json"
+        # Resolved once, so a later chdir doesn't move the config
+        self.config_file = os.path.abspath(config_file) if config_file else None
+        self.config = JSONStore(self.config_file)
+        self.power = "unknown"
+        self.volume = None
+        self.muted = None
+        self.current_app = None
+        self.status_events = StatusBroadcaster()
+        self._listening_sessions = set()
+        self._power_off_requested = 0
+        self._sweep_task = None
+        self._connect_seq = 0
+        self._connect_jobs = {}
+        self._connect_tasks = {}
+        # ID of the newest connect to have made its TV current; an older
+        # attempt that finishes later must not switch TVs back
+        self._adopted_job = 0
         self.load_config()
 
-    def load_config(self):
-        """Load TV configuration from file"""
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        """Stop background work and close the TV sessions of the running loop
+
+        Sessions are shared by every remote on the loop, so this closes them
+        for all of them; call it once the loop is done with TVs.
+        """
+        tasks = [task for task in (*self._connect_tasks.values(), self._sweep_task) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.tv = None
+        self.connected = False
+        self.status_events.close()
+        await get_session_pool().close_all()
+        self.config.flush()
+
+    def load_config(self):
+        """Load TV configuration from file"""
+        config = self.config
+        self.tv_ip = config.get("ip", "")
+        self.tv_name = config.get("name", "Samsung TV")
+        self.tv_mac = config.get("mac", "")
+        self.discovery_mode = config.get("discovery_mode", "hybrid")
+        if self.discovery_mode not in DISCOVERY_MODES:
+            logger.warning("Unknown discovery mode %r, using hybrid", self.discovery_mode)
+            self.discovery_mode = "hybrid"
+        self.discovery_cache_ttl = config.get("discovery_cache_ttl", DISCOVERY_CACHE_TTL)
+        self.discovery_cache_max_age = config.get(
+            "discovery_cache_max_age", DISCOVERY_CACHE_MAX_AGE
+        )
+        self.key_interval = config.get("key_interval", KEY_INTERVAL)
+        self.scan_max_prefix = config.get("scan_max_prefix", SCAN_MAX_PREFIX)
+        self.keyboard_layout = tuple(config.get("keyboard_layout", KEYBOARD_LAYOUT))
+        self.keyboard_wrap = config.get("keyboard_wrap", False)
+        self.app_cache_ttl = config.get("app_cache_ttl", APP_CACHE_TTL)
+        self.metrics_log = config.get("metrics_log")
+        metrics.log_file = self.metrics_log
+        # Without a config file nothing is written, not even next to it
+        config_dir = self.config_file and os.path.dirname(self.config_file)
+
+        def config_path(name):
+            return os.path.join(config_dir, name) if self.config_file else None
+
+        self.fleet = TVFleet(config_path(FLEET_FILE))
+        self.app_catalog = AppCatalog(config_path(APP_CACHE_DIR), ttl=self.app_cache_ttl)
+        self.discovery_cache = DiscoveryCache(
+            config_path(DISCOVERY_CACHE_FILE),
+            ttl=self.discovery_cache_ttl,
+            max_age=self.discovery_cache_max_age,
+        )
+
+    def save_config(self):
+        """Save TV configuration to file, batched with other changes
+
+        Settings are only written when the file already has them or they
+        differ from the default, so a later release can change a default.
+        """
+        config = {"ip": self.tv_ip, "name": self.tv_name, "mac": self.tv_mac}
+        settings = {
+            "discovery_mode": (self.discovery_mode, "hybrid"),
+            "discovery_cache_ttl": (self.discovery_cache_ttl, DISCOVERY_CACHE_TTL),
+            "discovery_cache_max_age": (self.discovery_cache_max_age, DISCOVERY_CACHE_MAX_AGE),
+            "key_interval": (self.key_interval, KEY_INTERVAL),
+            "scan_max_prefix": (self.scan_max_prefix, SCAN_MAX_PREFIX),
+            "app_cache_ttl": (self.app_cache_ttl, APP_CACHE_TTL),
+        }
+        for key, (value, default) in settings.items():
+            if value != default or self.config.get(key) is not None:
+                config[key] = value
+        if self.metrics_log:
+            config["metrics_log"] = self.metrics_log
+        if self.keyboard_layout != KEYBOARD_LAYOUT or self.keyboard_wrap:
+            config["keyboard_layout"] = list(self.keyboard_layout)
+            config["keyboard_wrap"] = self.keyboard_wrap
+        self.config.update(config)
+
+    async def _probe(self, ip_address):
+        """Fetch a TV's device info and return (session, info)"""
+        session = get_session_pool().get(ip_address, port=TV_PORT)
+        info = await asyncio.wait_for(session.device_info(), COMMAND_TIMEOUT)
+        session.identity = tv_identity(info, ip_address)
+        return session, info
+
+    def _adopt(self, session, info, ip_address):
+        """Make session the current TV and remember it"""
+        self.tv = session
+        self.connected = True
+        self.tv_ip = ip_address
+        self.tv_name = info.get("name", "Samsung TV")
+        # Remembered so the TV can be woken once it is fully off
+        self.tv_mac = info.get("device", {}).get("wifiMac") or self.tv_mac
+        self.power = info.get("device", {}).get("PowerState", "on")
+        self.volume = self.muted = self.current_app = None
+        self.save_config()
+        if session not in self._listening_sessions:
+            self._listening_sessions.add(session)
+            session.add_listener(
+                lambda event, response: self._on_tv_event(session, event)
+            )
+        # Keyed by identity, so a TV that takes over an old DHCP lease
+        # doesn't get the previous TV's apps
+        self.app_catalog.refresh_in_background(session.identity, session)
+        self._refresh_volume()
+        self.publish_status()
+
+    async def connect(self, ip_address):
+        """Connect to Samsung TV"""
+        try:
+            session, info = await self._probe(ip_address)
+            self._adopted_job = self._connect_seq
+            self._adopt(session, info, ip_address)
+            # Open the remote-control channel now so the first key press
+            # doesn't pay for the TLS and channel handshake
+            warmup = asyncio.ensure_future(session.connect())
+            warmup.add_done_callback(self._report_warmup)
+            return True, f"Connected to {self.tv_name}"
+        except Exception as e:
+            self.tv = None
+            self.connected = False
+            self.publish_status()
+            return False, f"Connection failed: {str(e)}"
+
+    async def start_connect(self, ip_address, wait=False):
+        """Connect to a TV in the background and return the job's record
+
+        The job moves from "probing" (fetching device info) to
+        "awaiting_approval" when the TV has to show its pairing prompt, or
+        "connecting" when a token is already known, and ends as "ready"
+        once the channel is open or "failed". Any number of jobs can run
+        at once; the newest one to get ready becomes the current TV.
+        Pass wait=True to return only once the job has finished.
+        """
+        self._connect_seq += 1
+        now = time.time()
+        job = {
+            "id": self._connect_seq,
+            "ip": ip_address,
+            "status": "probing",
+            "final": False,
+            "message": f"Checking {ip_address}",
+            "tv_name": None,
+            "created": now,
+            "updated": now,
+        }
+        self._connect_jobs[job["id"]] = job
+        while len(self._connect_jobs) > CONNECT_JOB_HISTORY:
+            del self._connect_jobs[next(iter(self._connect_jobs))]
+        task = asyncio.ensure_future(self._run_connect_job(job))
+        self._connect_tasks[job["id"]] = task
+        task.add_done_callback(lambda _: self._connect_tasks.pop(job["id"], None))
+        self.publish_status()
+        if wait:
+            # Shielded so a cancelled caller doesn't abort the connect
+            await asyncio.shield(task)
+        return dict(job)
+
+    def get_connect_jobs(self, ids=None):
+        """Return connect job records by ID, or every remembered job"""
+        if ids is None:
+            return [dict(job) for job in list(self._connect_jobs.values())]
+        return [dict(self._connect_jobs[i]) for i in ids if i in self._connect_jobs]
+
+    def _update_job(self, job, status, message):
+        job["status"] = status
+        job["message"] = message
+        job["final"] = status in ("ready", "failed")
+        job["updated"] = time.time()
+        self.publish_status()
+
+    async def _run_connect_job(self, job):
+        ip_address = job["ip"]
         try:
-            if os.path.exists(self.config_file):
-                with open(self.config_file, "r") as f:
-                    config = json.load(f)
-                    self.tv_ip = config.get("ip", "")
-                    self.tv_name = config.get("name", "Samsung TV")
-            else:
-                self.tv_ip = ""
-                self.tv_name = "Samsung TV"
+            session, info = await self._probe(ip_address)
+            name = job["tv_name"] = info.get("name", "Samsung TV")
+            if not session.is_alive():
+                if session.token_store.has_token(session.identity):
+                    self._update_job(job, "connecting", f"Opening a channel to {name}")
+                else:
+                    self._update_job(
+                        job, "awaiting_approval", f"Accept the connection prompt on {name}"
+                    )
+            await session.connect()
+            if job["id"] > self._adopted_job:
+                self._adopted_job = job["id"]
+                self._adopt(session, info, ip_address)
+            self._update_job(job, "ready", f"Connected to {name}")
+        except asyncio.CancelledError:
+            self._update_job(job, "failed", "Connection cancelled")
+            raise
         except Exception as e:
-            print(f"Error loading config: {e}")
-            self.tv_ip = ""
-            self.tv_name = "Samsung TV"
+            self._update_job(job, "failed", f"Connection failed: {str(e)}")
 
-    def save_config(self):
-        """Save TV configuration to file"""
+    def find_mac(self, ip_address):
+        """Return the last known MAC for ip_address, or an empty string"""
+        if ip_address == self.tv_ip and self.tv_mac:
+            return self.tv_mac
+        for tv in self.fleet.list() + self.discovery_cache.entries():
+            if tv.get("ip") == ip_address and tv.get("mac"):
+                return tv["mac"]
+        return ""
+
+    async def power_on(self, ip_address=None):
+        """Wake the TV with Wake-on-LAN and connect once it accepts keys"""
+        ip_address = ip_address or self.tv_ip
+        if not ip_address:
+            return False, "No TV to power on", None
+        mac = self.find_mac(ip_address)
+        if not mac:
+            return False, "MAC address unknown; connect to the TV once while it is on", None
+
+        # The channel opens as soon as the TV is up, so it must already look
+        # up the token stored under the TV's identity rather than its IP
+        session = get_session_pool().get(
+            ip_address, port=TV_PORT, identity=mac_identity(mac)
+        )
         try:
-            config = {"ip": self.tv_ip, "name": self.tv_name}
-            with open(self.config_file, "w") as f:
-                json.dump(config, f)
+            elapsed = await session.wake(mac)
         except Exception as e:
-            print(f"Error saving config: {e}")
+            return False, f"Power on failed: {str(e)}", None
+        success, message = await self.connect(ip_address)
+        if not success:
+            return False, message, elapsed
+        return True, f"{self.tv_name} is on and ready after {elapsed:.1f}s", elapsed
 
-    def connect_to_tv(self, ip_address):
-        """Connect to Samsung TV"""
-        try:
-            # self.tv = SamsungTVWS(host=ip_address)
-            token_file = os.path.dirname(os.path.realpath(__file__)) + "/tv-token.txt"
-            self.tv = SamsungTVWS(host=ip_address, port=8002, token_file=token_file)
-            info = self.tv.rest_device_info()
+    def _report_warmup(self, future):
+        if not future.cancelled() and future.exception():
+            logger.warning("Error opening TV channel: %s", future.exception())
+
+    def _on_tv_event(self, session, event):
+        """Track connection and power state from the TV's channel"""
+        if session is not self.tv:
+            return
+        if event == "session.open":
             self.connected = True
-            self.tv_ip = ip_address
-            self.tv_name = info.get("name", "Samsung TV")
-            # apps = self.tv.app_list()
-            self.save_config()
-            return True, f"Connected to {self.tv_name}"
-        except Exception as e:
+            self.power = "on"
+        elif event == "session.closed":
             self.connected = False
-            return False, f"Connection failed: {str(e)}"
+            recently_powered_off = (
+                time.monotonic() - self._power_off_requested < POWER_OFF_WINDOW
+            )
+            self.power = "off" if recently_powered_off else "unknown"
+            self.current_app = None
+        else:
+            return
+        self.publish_status()
+
+    def _refresh_volume(self):
+        """Re-read volume and mute state without blocking the caller"""
+        session = self.tv
+
+        async def refresh():
+            try:
+                volume, muted = await session.volume()
+            except Exception:
+                # Not every model exposes the UPnP renderer
+                return
+            if session is self.tv:
+                self.volume, self.muted = volume, muted
+                self.publish_status()
+
+        asyncio.ensure_future(refresh())
+
+    def publish_status(self):
+        """Push the current status to every event-stream client"""
+        self.status_events.publish(self.get_status())
+
+    async def send_key(self, key, action="click", wait=True):
+        """Queue a key for the TV and report how far it got
+
+        action is "click" for a single press (repeats are coalesced into a
+        held key), or "press"/"release" to hold the key explicitly. With
+        wait=False the key is only queued; its record can be looked up later
+        with get_commands(). Returns (success, message, command record).
+        """
+        if not self.tv:
+            return False, "Not connected to TV", None
+        if action not in KEY_ACTIONS:
+            return False, f"Unknown key action: {action}", None
+
+        session = self.tv
+
+        async def send():
+            outcome = await getattr(session.keys, action)(key)
+            if key in VOLUME_KEYS and outcome != "merged":
+                self._refresh_volume()
+            return outcome
 
-    def send_key(self, key):
-        """Send key command to TV"""
-        if not self.connected or not self.tv:
-            return False, "Not connected to TV"
+        if key in POWER_OFF_KEYS:
+            self._power_off_requested = time.monotonic()
+        record = await self._submit("key", send, wait, key=key, action=action)
+        if record["status"] == "failed":
+            return False, f"Error sending key: {record['error']}", record
+        if not record["final"]:
+            return True, f"Queued key {key} as #{record['id']}", record
+        if record.get("result") == "sent":
+            return True, f"Sent key: {key}", record
+        return True, f"Key {key} {record.get('result')}", record
 
+    async def _submit(self, command, send, wait, reply_event=None, **details):
+        """Put a command on the current TV's queue, optionally waiting for it"""
+        commands = self.tv.commands
         try:
-            self.tv.send_key(key)
-            return True, f"Sent key: {key}"
+            record = await commands.submit(command, send, reply_event, **details)
+            if wait:
+                record = await asyncio.wait_for(
+                    commands.wait(record["id"]), COMMAND_DEADLINE + COMMAND_TIMEOUT
+                )
         except Exception as e:
-            print(e)
-            return False, f"Error sending key: {str(e)}"
+            logger.warning("Error queueing %s for %s: %s", command, self.tv_ip, e)
+            return {"command": command, **details, "status": "failed", "final": True, "error": str(e)}
+        return record
 
-    def get_apps(self):
-        """Get list of installed apps"""
-        if not self.connected or not self.tv:
+    def get_commands(self, ids=None):
+        """Return queued command records for the current TV, by ID or all recent"""
+        if not self.tv:
             return []
+        if ids is None:
+            return self.tv.commands.recent()
+        return [record for record in map(self.tv.commands.get, ids) if record]
+
+    def plan_key_sequence(self, keys, interval=None):
+        """Expand a macro into (key, delay) steps
+
+        Each item is either a key name or {"key", "repeat", "delay"}; delay
+        overrides the pause after that key and defaults to interval.
+        """
+        interval = self.key_interval if interval is None else float(interval)
+        if not 0 <= interval <= KEY_SEQUENCE_MAX_DELAY:
+            raise ValueError(f"Interval must be between 0 and {KEY_SEQUENCE_MAX_DELAY}s")
+
+        steps = []
+        for item in keys:
+            if isinstance(item, str):
+                item = {"key": item}
+            if not isinstance(item, dict) or not item.get("key"):
+                raise ValueError(f"Invalid key entry: {item!r}")
+            repeat = int(item.get("repeat", 1))
+            delay = float(item.get("delay", interval))
+            if repeat < 1 or not 0 <= delay <= KEY_SEQUENCE_MAX_DELAY:
+                raise ValueError(f"Invalid repeat or delay for {item['key']}")
+            if len(steps) + repeat > KEY_SEQUENCE_MAX_KEYS:
+                raise ValueError(f"At most {KEY_SEQUENCE_MAX_KEYS} keys per request")
+            steps.extend([(item["key"], delay)] * repeat)
+        if steps:
+            # No need to wait after the last key
+            steps[-1] = (steps[-1][0], 0)
+        return steps
+
+    async def send_keys(self, keys, interval=None):
+        """Send an ordered macro of keys over the open TV session"""
+        if not self.tv:
+            return False, "Not connected to TV", []
 
         try:
-            apps = self.tv.app_list()
-            return apps
+            steps = self.plan_key_sequence(keys, interval)
+        except (TypeError, ValueError) as e:
+            return False, str(e), []
+
+        timeout = COMMAND_TIMEOUT + sum(delay for _, delay in steps)
+        try:
+            results = await asyncio.wait_for(self.tv.send_keys(steps), timeout)
         except Exception as e:
-            print(f"Error getting apps: {e}")
-            return []
+            logger.warning("Error sending keys to %s: %s", self.tv_ip, e)
+            return False, f"Error sending keys: {str(e)}", []
+        sent = sum(1 for result in results if result["success"])
+        return sent == len(steps), f"Sent {sent}/{len(steps)} keys", results
+
+    async def send_text(self, text, method="auto"):
+        """Type text into the text field focused on the TV
+
+        While the TV's input method is open (it announces this when a text
+        field is focused) the whole string goes out in one frame, through
+        the command queue. Otherwise, or with method="keyboard", it is typed
+        on the on-screen keyboard as a macro of arrow keys. method="ime"
+        always uses the input method. Returns (success, message, details).
+        """
+        if not self.tv:
+            return False, "Not connected to TV", None
+        if method not in TEXT_METHODS:
+            return False, f"Unknown text method: {method}", None
+        if not isinstance(text, str) or not 0 < len(text) <= TEXT_MAX_LENGTH:
+            return False, f"Text must be 1 to {TEXT_MAX_LENGTH} characters", None
+
+        session = self.tv
+        if method == "ime" or (method == "auto" and session.ime_active):
+            # The text itself is left out of the command history
+            record = await self._submit(
+                "text", lambda: session.send_text(text), True, length=len(text)
+            )
+            details = {"method": "ime", "command": record}
+            if record["status"] == "failed":
+                return False, f"Error sending text: {record['error']}", details
+            return True, f"Sent {len(text)} characters", details
+
+        try:
+            # Most on-screen keyboards have a single case shown at a time
+            keys = plan_keyboard_path(
+                text, self.keyboard_layout, self.keyboard_wrap, fold_case=True
+            )
+        except ValueError as e:
+            return False, str(e), None
+        case_changed = keyboard_case_changes(text, self.keyboard_layout)
+        steps = [(key, self.key_interval) for key in keys]
+        steps[-1] = (steps[-1][0], 0)
+        timeout = COMMAND_TIMEOUT + sum(delay for _, delay in steps)
+        try:
+            results = await asyncio.wait_for(session.send_keys(steps), timeout)
+        except Exception as e:
+            logger.warning("Error typing text on %s: %s", self.tv_ip, e)
+            return False, f"Error typing text: {str(e)}", None
+        sent = sum(1 for result in results if result["success"])
+        details = {
+            "method": "keyboard",
+            "keys": len(steps),
+            "case_changed": case_changed,
+            "results": results,
+        }
+        if sent < len(steps):
+            return False, f"Typed {sent}/{len(steps)} keys", details
+        message = f"Typed {len(text)} characters with {len(steps)} keys"
+        if case_changed:
+            message += f"; typed {', '.join(case_changed)} in the other case"
+        return True, message, details
+
+    async def get_apps(self):
+        """Get list of installed apps"""
+        return (await self.get_apps_with_etag())[0]
+
+    async def get_apps_with_etag(self):
+        """Return (apps, etag) from the app cache, querying the TV only when needed
+
+        A stale cache is returned as-is while a refresh runs in the background;
+        the TV is only waited on when nothing is cached yet.
+        """
+        if not self.tv:
+            return [], None
 
-    def launch_app(self, app_id):
-        """Launch specific app"""
-        if not self.connected or not self.tv:
-            return False, "Not connected to TV"
+        tv_id = self.tv.identity
+        apps, etag, is_fresh = self.app_catalog.get(tv_id)
+        if apps is not None:
+            if not is_fresh:
+                self.app_catalog.refresh_in_background(tv_id, self.tv)
+            return apps, etag
 
+        refresh = self.app_catalog.refresh_in_background(tv_id, self.tv)
         try:
-            self.tv.run_app(app_id)
-            return True, f"Launched app: {app_id}"
+            # Shielded so a cancelled caller doesn't abort the shared refresh
+            await asyncio.wait_for(asyncio.shield(refresh), COMMAND_TIMEOUT)
         except Exception as e:
-            return False, f"Error launching app: {str(e)}"
+            logger.warning("Error getting apps: %s", e)
+        apps, etag, _ = self.app_catalog.get(tv_id)
+        return apps or [], etag
+
+    async def launch_app(self, app_id, wait=True):
+        """Queue an app launch and report whether the TV acknowledged it"""
+        if not self.tv:
+            return False, "Not connected to TV", None
+
+        session = self.tv
+
+        async def launch():
+            await session.run_app(app_id)
+            self.current_app = app_id
+            self.publish_status()
+
+        record = await self._submit("launch", launch, wait, "ed.apps.launch", app_id=app_id)
+        if record["status"] == "failed":
+            return False, f"Error launching app: {record['error']}", record
+        if not record["final"]:
+            return True, f"Queued launch of {app_id} as #{record['id']}", record
+        if record["status"] == "acknowledged":
+            return True, f"Launched app: {app_id}", record
+        return True, f"Launched app: {app_id} (not confirmed by the TV)", record
 
     def get_status(self):
         """Get current connection status"""
@@ -102,6 +2699,13 @@ class SamsungTVRemote:
             "connected": self.connected,
             "tv_ip": self.tv_ip,
             "tv_name": self.tv_name,
+            "power": self.power,
+            "volume": self.volume,
+            "muted": self.muted,
+            "app": self.current_app,
+            "connecting": [
+                dict(job) for job in list(self._connect_jobs.values()) if not job["final"]
+            ],
         }
 
     def get_local_ip(self):
@@ -113,106 +2717,411 @@ class SamsungTVRemote:
                 s.connect(("8.8.8.8", 80))
                 return s.getsockname()[0]
         except Exception:
-            return "127.0.0.1"
+            # No default route, but a LAN may still be attached
+            interfaces = local_ipv4_interfaces()
+            return str(interfaces[0].ip) if interfaces else "127.0.0.1"
+
+    def get_network_ranges(self):
+        """Get every attached IPv4 network to scan
+
+        Networks wider than the scan_max_prefix setting are narrowed to the
+        block around this machine's address. Without interface information
+        the routed address's /24 is guessed.
+        """
+        ranges = []
+        for interface in local_ipv4_interfaces():
+            network = interface.network
+            if network.prefixlen < self.scan_max_prefix:
+                narrowed = ipaddress.IPv4Interface(
+                    f"{interface.ip}/{self.scan_max_prefix}"
+                ).network
+                logger.warning(
+                    "%s is wider than /%s; only scanning %s around %s",
+                    network,
+                    self.scan_max_prefix,
+                    narrowed,
+                    interface.ip,
+                )
+                network = narrowed
+            if str(network) not in ranges:
+                ranges.append(str(network))
+        if not ranges:
+            local_ip = self.get_local_ip()
+            ranges.append(f"{local_ip.rsplit('.', 1)[0]}.0/24")
+        return ranges
 
     def get_network_range(self):
         """Get the network range to scan based on local IP"""
-        local_ip = self.get_local_ip()
+        return self.get_network_ranges()[0]
+
+    async def is_samsung_tv(self, ip):
+        """Check if an IP address belongs to a Samsung TV"""
         try:
-            # Get the network interface
-            for interface in socket.if_nameindex():
-                try:
-                    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-                        s.connect(("8.8.8.8", 80))
-                        if s.getsockname()[0] == local_ip:
-                            # This is a simplified approach - in production you might want
-                            # to use netifaces or similar to get the actual netmask
-                            return f"{local_ip.rsplit('.', 1)[0]}.0/24"
-                except:
+            tv = await NetworkScanner().check_host(ip)
+            if tv:
+                return True, tv["name"]
+            return False, None
+        except Exception:
+            return False, None
+
+    def _plan_scan(self, network_range, known=()):
+        """Return the stages of hosts to probe, likeliest TVs first"""
+        if self.discovery_mode == "passive":
+            return [list(known), [], []]
+        ranges = [network_range] if network_range else self.get_network_ranges()
+        print(f"Scanning network: {', '.join(ranges)}")
+        return plan_scan(ranges, known, read_neighbor_table())
+
+    def _start_background_sweep(self, hosts):
+        """Look for new TVs without making the caller wait"""
+        if self._sweep_task and not self._sweep_task.done():
+            return
+        self._sweep_task = asyncio.ensure_future(
+            discover_tvs(
+                self.discovery_mode, hosts, on_found=self.discovery_cache.update
+            )
+        )
+
+    async def iter_scan(self, network_range=None, refresh=False):
+        """Yield each Samsung TV on the local network as soon as it is found
+
+        Fresh cache entries are returned straight away and stale ones are
+        re-checked next. On a warm cache the sweep for new TVs runs in the
+        background; pass refresh=True to always wait for a full sweep.
+        """
+        cache = self.discovery_cache
+        fresh, stale = cache.split_fresh()
+        if refresh:
+            fresh, stale = [], fresh + stale
+        for tv in fresh:
+            yield tv
+
+        # Recently seen TVs and neighbors with a Samsung MAC are probed
+        # first, then other hosts known to be up, then the full sweep
+        stale.sort(key=lambda tv: tv.get("last_seen", 0), reverse=True)
+        # Reading interfaces, the neighbor table and the OUI list can block,
+        # and this loop carries every TV's key presses
+        stages = await asyncio.to_thread(
+            self._plan_scan, network_range, [tv["ip"] for tv in stale]
+        )
+        results = asyncio.Queue()
+        finished = object()
+        reported = {tv["ip"] for tv in fresh}
+        sweep_later = bool(fresh)
+
+        def on_found(tv):
+            cache.update(tv)
+            if tv["ip"] not in reported:
+                reported.add(tv["ip"])
+                results.put_nowait(tv)
+
+        async def run_discovery():
+            nonlocal sweep_later
+            if fresh:
+                if stale:
+                    await NetworkScanner().scan([tv["ip"] for tv in stale], on_found)
+                return
+            for hosts in stages[:-1]:
+                if not hosts:
                     continue
-        except:
-            pass
-        # Fallback to common home network ranges
-        return f"{local_ip.rsplit('.', 1)[0]}.0/24"
+                await NetworkScanner().scan(hosts, on_found)
+                if reported and not refresh:
+                    # Found without a sweep; look for other TVs in the background
+                    sweep_later = True
+                    return
+            await discover_tvs(self.discovery_mode, stages[-1], on_found=on_found)
+
+        task = asyncio.ensure_future(run_discovery())
+        task.add_done_callback(lambda _: results.put_nowait(finished))
+        try:
+            while True:
+                tv = await results.get()
+                if tv is finished:
+                    break
+                print(f"Found Samsung TV: {tv['ip']} ({tv['name']})")
+                yield tv
+            task.result()
+        finally:
+            # Stop probing if the consumer goes away mid-scan
+            task.cancel()
+
+        if sweep_later:
+            self._start_background_sweep(
+                [ip for hosts in stages for ip in hosts if ip not in reported]
+            )
+
+    async def scan(self, network_range=None, refresh=False):
+        """Scan the local network for Samsung TVs"""
+        try:
+            return [tv async for tv in self.iter_scan(network_range, refresh)]
+        except Exception as e:
+            logger.warning("Error scanning network: %s", e)
+            return []
+
+
+class SamsungTVRemote:
+    """Blocking wrapper around AsyncSamsungTVRemote
+
+    Coroutines run on the shared background event loop. Everything else,
+    including state such as tv_ip or fleet, is read from and written to
+    the wrapped async remote.
+    """
+
+    def __init__(self, config_file="tv_config.json"):
+        object.__setattr__(self, "aio", AsyncSamsungTVRemote(config_file))
+
+    def __getattr__(self, name):
+        return getattr(self.aio, name)
+
+    def __setattr__(self, name, value):
+        setattr(self.aio, name, value)
+
+    def _run(self, coro, timeout=None):
+        return get_event_loop_thread().run(coro, timeout)
+
+    def connect_to_tv(self, ip_address):
+        """Connect to Samsung TV"""
+        return self._run(self.aio.connect(ip_address))
+
+    def start_connect(self, ip_address, wait=False):
+        """Connect to a TV in the background and return the job's record"""
+        return self._run(self.aio.start_connect(ip_address, wait))
+
+    def power_on(self, ip_address=None):
+        """Wake the TV with Wake-on-LAN and connect once it accepts keys"""
+        return self._run(self.aio.power_on(ip_address))
+
+    def send_key(self, key, action="click", wait=True):
+        """Queue a key for the TV and report how far it got"""
+        return self._run(self.aio.send_key(key, action, wait))
+
+    def send_keys(self, keys, interval=None):
+        """Send an ordered macro of keys over the open TV session"""
+        return self._run(self.aio.send_keys(keys, interval))
+
+    def send_text(self, text, method="auto"):
+        """Type text into the text field focused on the TV"""
+        return self._run(self.aio.send_text(text, method))
+
+    def get_apps(self):
+        """Get list of installed apps"""
+        return self._run(self.aio.get_apps())
+
+    def get_apps_with_etag(self):
+        """Return (apps, etag) from the app cache, querying the TV only when needed"""
+        return self._run(self.aio.get_apps_with_etag())
+
+    def launch_app(self, app_id, wait=True):
+        """Queue an app launch and report whether the TV acknowledged it"""
+        return self._run(self.aio.launch_app(app_id, wait))
 
     def is_samsung_tv(self, ip):
         """Check if an IP address belongs to a Samsung TV"""
+        return self._run(self.aio.is_samsung_tv(ip))
+
+    def iter_scan_network(self, network_range=None, refresh=False):
+        """Yield each Samsung TV on the local network as soon as it is found"""
+        scan = self.aio.iter_scan(network_range, refresh)
         try:
-            # Try to connect to Samsung TV WebSocket port
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                s.settimeout(1)
-                result = s.connect_ex((ip, 8002))
-                if result == 0:
-                    # Port is open, try to get device info
-                    try:
-                        token_file = (
-                            os.path.dirname(os.path.realpath(__file__))
-                            + "/tv-token.txt"
-                        )
-                        test_tv = SamsungTVWS(host=ip, port=8002, token_file=token_file)
-                        info = test_tv.rest_device_info()
-                        if info and "name" in info:
-                            return True, info.get("name", "Samsung TV")
-                    except:
-                        pass
-            return False, None
-        except:
-            return False, None
+            while True:
+                try:
+                    yield self._run(anext(scan))
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run(scan.aclose())
 
-    def scan_network(self):
+    def scan_network(self, network_range=None, refresh=False):
         """Scan the local network for Samsung TVs"""
-        network_range = self.get_network_range()
-        print(f"Scanning network: {network_range}")
+        return self._run(self.aio.scan(network_range, refresh))
+
 
+class StaticAsset:
+    """One UI file, encoded and compressed once"""
+
+    def __init__(self, data, content_type, max_age=STATIC_MAX_AGE):
+        self.content_type = content_type
+        self.cache_control = f"public, max-age={max_age}"
+        self.digest = hashlib.sha256(data).hexdigest()[:32]
+        self.bodies = {"identity": data, "gzip": gzip.compress(data, 9, mtime=0)}
         try:
-            network = ipaddress.IPv4Network(network_range, strict=False)
-            found_tvs = []
+            import brotli
+        except ImportError:
+            return
+        self.bodies["br"] = brotli.compress(data, quality=11)
 
-            # Use ThreadPoolExecutor for concurrent scanning
-            with concurrent.futures.ThreadPoolExecutor(max_workers=50) as executor:
-                # Submit all IP addresses for scanning
-                future_to_ip = {
-                    executor.submit(self.is_samsung_tv, str(ip)): str(ip)
-                    for ip in network.hosts()
-                }
+    def etag(self, encoding):
+        # Strong ETags must differ per content-coding
+        if encoding == "identity":
+            return f'"{self.digest}"'
+        return f'"{self.digest}-{encoding}"'
 
-                # Process completed scans
-                for future in concurrent.futures.as_completed(future_to_ip, timeout=30):
-                    ip = future_to_ip[future]
-                    try:
-                        is_tv, name = future.result()
-                        if is_tv:
-                            found_tvs.append({"ip": ip, "name": name})
-                            print(f"Found Samsung TV: {ip} ({name})")
-                    except concurrent.futures.TimeoutError:
-                        print(f"Timeout scanning {ip}")
-                    except Exception as e:
-                        print(f"Error scanning {ip}: {e}")
-
-            return found_tvs
+    def matches(self, if_none_match):
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        return any(self.etag(encoding) in tags for encoding in self.bodies)
+
+    def pick_encoding(self, accept_encoding):
+        accepted = set()
+        for item in accept_encoding.split(","):
+            coding, _, params = item.strip().partition(";")
+            if params.replace(" ", "") in ("q=0", "q=0.0"):
+                continue
+            accepted.add(coding.strip().lower())
+        for encoding in ("br", "gzip"):
+            if encoding in self.bodies and encoding in accepted:
+                return encoding
+        return "identity"
+
+
+class StaticAssets:
+    """Precompressed UI assets loaded from the static directory at startup"""
+
+    def __init__(self, directory=STATIC_DIR):
+        self.directory = directory
+        self.assets = {}
+        self.load()
+
+    def load(self):
+        import mimetypes
+
+        assets = {}
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                url = "/" + os.path.relpath(path, self.directory).replace(os.sep, "/")
+                content_type = mimetypes.guess_type(filename)[0]
+                if content_type is None:
+                    content_type = "application/octet-stream"
+                elif content_type.startswith("text/") or content_type in (
+                    "application/javascript",
+                    "application/json",
+                ):
+                    content_type += "; charset=utf-8"
+                with open(path, "rb") as f:
+                    assets[url] = StaticAsset(f.read(), content_type)
+        self.assets = assets
+
+    def get(self, path):
+        if path == "/":
+            path = "/index.html"
+        return self.assets.get(path)
 
-        except Exception as e:
-            print(f"Error scanning network: {e}")
-            return []
+
+class _Lazy:
+    """Class attribute built by factory on first access"""
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._value = None
+        self._lock = threading.Lock()
+
+    def __get__(self, instance, owner):
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = self.factory()
+        return self._value
 
 
 class RemoteHandler(BaseHTTPRequestHandler):
-    remote = SamsungTVRemote()
+    # Reading the config and compressing the UI wait until first use, so
+    # importing the module stays cheap and the server listens at once
+    remote = _Lazy(SamsungTVRemote)
+    static = _Lazy(StaticAssets)
+
+    def handle_one_request(self):
+        """Handle one request and record its latency and outcome"""
+        self._status = None
+        self._failed = False
+        # Not set when the request line can't be parsed; reset so a kept-alive
+        # connection doesn't report the previous request's path
+        self.path = ""
+        started = time.perf_counter()
+        outcome = "success"
+        try:
+            super().handle_one_request()
+        except TimeoutError:
+            outcome = "timeout"
+            raise
+        except BaseException:
+            outcome = "failure"
+            raise
+        finally:
+            if self._status is not None and getattr(self, "path", ""):
+                if outcome == "success" and (self._status >= 400 or self._failed):
+                    outcome = "failure"
+                path = urlparse(self.path).path
+                if path not in HTTP_ROUTES and not self.static.get(path):
+                    path = "other"
+                elapsed = time.perf_counter() - started
+                HTTP_REQUEST_SECONDS.observe(elapsed, method=self.command, path=path)
+                HTTP_REQUESTS.inc(method=self.command, path=path, outcome=outcome)
+                metrics.log(
+                    {
+                        "metric": HTTP_REQUEST_SECONDS.name,
+                        "seconds": round(elapsed, 6),
+                        "outcome": outcome,
+                        "method": self.command,
+                        "path": path,
+                        "status": self._status,
+                    }
+                )
+
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
 
     def do_GET(self):
         """Handle GET requests"""
         parsed_path = urlparse(self.path)
 
-        if parsed_path.path == "/":
-            self.serve_html()
+        if parsed_path.path == "/" or self.static.get(parsed_path.path):
+            self.serve_static(parsed_path.path)
         elif parsed_path.path == "/api/status":
             self.serve_json(self.remote.get_status())
+        elif parsed_path.path == "/api/events":
+            self.stream_events()
+        elif parsed_path.path == "/api/commands":
+            try:
+                ids = self.query_ids(parsed_path.query)
+            except ValueError:
+                self.send_error(400)
+                return
+            self.serve_json({"commands": self.remote.get_commands(ids)})
+        elif parsed_path.path == "/api/connect/status":
+            try:
+                ids = self.query_ids(parsed_path.query)
+            except ValueError:
+                self.send_error(400)
+                return
+            self.serve_json({"jobs": self.remote.get_connect_jobs(ids)})
+        elif parsed_path.path == "/metrics":
+            self.serve_metrics()
+        elif parsed_path.path == "/api/fleet":
+            self.serve_json({"tvs": self.remote.fleet.list()})
         elif parsed_path.path == "/api/apps":
-            apps = self.remote.get_apps()
-            self.serve_json({"apps": apps})
+            apps, etag = self.remote.get_apps_with_etag()
+            if etag and self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+            else:
+                self.serve_json({"apps": apps}, etag=etag)
+        elif parsed_path.path == "/api/apps/icon":
+            app_id = parse_qs(parsed_path.query).get("app_id", [""])[0]
+            self.serve_app_icon(app_id)
         elif parsed_path.path == "/api/scan":
-            found_tvs = self.remote.scan_network()
-            self.serve_json({"success": True, "tvs": found_tvs})
+            query = parse_qs(parsed_path.query)
+            refresh = query.get("refresh", ["0"])[0] in ("1", "true")
+            if query.get("stream", ["0"])[0] in ("1", "true"):
+                self.stream_scan(refresh)
+            else:
+                found_tvs = self.remote.scan_network(refresh=refresh)
+                self.serve_json({"success": True, "tvs": found_tvs})
         else:
             self.send_error(404)
 
@@ -231,624 +3140,268 @@ class RemoteHandler(BaseHTTPRequestHandler):
         if parsed_path.path == "/api/connect":
             ip = data.get("ip", "").strip()
             if ip:
-                success, message = self.remote.connect_to_tv(ip)
-                self.serve_json({"success": success, "message": message})
+                # Returns at once unless asked to wait; progress is polled
+                # from /api/connect/status
+                job = self.remote.start_connect(ip, data.get("wait", False))
+                self.serve_json(
+                    {"success": job["status"] != "failed", "message": job["message"], "job": job}
+                )
             else:
                 self.serve_json({"success": False, "message": "IP address required"})
 
         elif parsed_path.path == "/api/key":
             key = data.get("key", "")
             if key:
-                success, message = self.remote.send_key(key)
-                self.serve_json({"success": success, "message": message})
+                success, message, command = self.remote.send_key(
+                    key, data.get("action", "click"), data.get("wait", True)
+                )
+                self.serve_json({"success": success, "message": message, "command": command})
             else:
                 self.serve_json({"success": False, "message": "Key required"})
 
+        elif parsed_path.path == "/api/keys":
+            keys = data.get("keys", [])
+            if keys and isinstance(keys, list):
+                success, message, results = self.remote.send_keys(
+                    keys, data.get("interval")
+                )
+                self.serve_json(
+                    {"success": success, "message": message, "results": results}
+                )
+            else:
+                self.serve_json({"success": False, "message": "Keys required"})
+
+        elif parsed_path.path == "/api/text":
+            text = data.get("text", "")
+            if text:
+                success, message, details = self.remote.send_text(
+                    text, data.get("method", "auto")
+                )
+                self.serve_json({"success": success, "message": message, **(details or {})})
+            else:
+                self.serve_json({"success": False, "message": "Text required"})
+
+        elif parsed_path.path == "/api/power_on":
+            ip = data.get("ip") or ""
+            if not isinstance(ip, str):
+                self.send_error(400, "IP must be a string")
+            else:
+                success, message, elapsed = self.remote.power_on(ip.strip())
+                self.serve_json({"success": success, "message": message, "elapsed": elapsed})
+
+        elif parsed_path.path == "/api/fleet/register":
+            ip = data.get("ip") or ""
+            name = data.get("name")
+            room = data.get("room") or ""
+            tags = data.get("tags", [])
+            try:
+                port = int(data.get("port", TV_PORT))
+            except (TypeError, ValueError):
+                port = 0
+            if not all(isinstance(value, str) for value in (ip, name or "", room)):
+                self.send_error(400, "IP, name and room must be strings")
+            elif not 0 < port < 65536:
+                self.send_error(400, "Port must be a number from 1 to 65535")
+            elif not isinstance(tags, list) or not all(isinstance(tag, str) for tag in tags):
+                self.send_error(400, "Tags must be a list of strings")
+            elif ip.strip():
+                ip = ip.strip()
+                tv = self.remote.fleet.register(
+                    ip,
+                    name=name,
+                    room=room,
+                    tags=tags,
+                    port=port,
+                )
+                message = "Registered" if tv["verified"] else f"Registered, but {ip} did not answer"
+                self.serve_json({"success": True, "message": message, "tv": tv})
+            else:
+                self.serve_json({"success": False, "message": "IP address required"})
+
+        elif parsed_path.path == "/api/fleet/remove":
+            removed = self.remote.fleet.remove(data.get("id", ""))
+            self.serve_json({"success": removed})
+
+        elif parsed_path.path in (
+            "/api/fleet/connect",
+            "/api/fleet/key",
+            "/api/fleet/launch",
+            "/api/fleet/power_on",
+        ):
+            self.serve_fleet_command(parsed_path.path.rsplit("/", 1)[1], data)
+
         elif parsed_path.path == "/api/launch":
             app_id = data.get("app_id", "")
             if app_id:
-                success, message = self.remote.launch_app(app_id)
-                self.serve_json({"success": success, "message": message})
+                success, message, command = self.remote.launch_app(
+                    app_id, data.get("wait", True)
+                )
+                self.serve_json({"success": success, "message": message, "command": command})
             else:
                 self.serve_json({"success": False, "message": "App ID required"})
 
         else:
             self.send_error(404)
 
-    def serve_html(self):
-        """Serve the main HTML page"""
-        html_content = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Samsung TV Remote</title>
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-        }
-        
-        .container {
-            max-width: 400px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 20px;
-            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-            overflow: hidden;
-        }
-        
-        .header {
-            background: linear-gradient(135deg, #2c3e50, #34495e);
-            color: white;
-            padding: 20px;
-            text-align: center;
-        }
-        
-        .status {
-            padding: 15px;
-            text-align: center;
-            font-weight: bold;
-            transition: all 0.3s ease;
-        }
-        
-        .status.connected {
-            background: #27ae60;
-            color: white;
-        }
-        
-        .status.disconnected {
-            background: #e74c3c;
-            color: white;
-        }
-        
-        .status.connecting {
-            background: #f39c12;
-            color: white;
-        }
-        
-        .connection-panel {
-            padding: 20px;
-            border-bottom: 1px solid #eee;
-        }
-        
-        .input-group {
-            display: flex;
-            gap: 10px;
-            margin-bottom: 10px;
-        }
-        
-        input[type="text"] {
-            flex: 1;
-            padding: 12px;
-            border: 2px solid #ddd;
-            border-radius: 8px;
-            font-size: 16px;
-        }
-        
-        button {
-            padding: 12px 20px;
-            border: none;
-            border-radius: 8px;
-            font-size: 14px;
-            font-weight: bold;
-            cursor: pointer;
-            transition: all 0.3s ease;
-        }
-        
-        .btn-primary {
-            background: #3498db;
-            color: white;
-        }
-        
-        .btn-primary:hover {
-            background: #2980b9;
-            transform: translateY(-2px);
-        }
-        
-        .btn-danger {
-            background: #e74c3c;
-            color: white;
-        }
-        
-        .btn-success {
-            background: #27ae60;
-            color: white;
-        }
-        
-        .btn-warning {
-            background: #f39c12;
-            color: white;
-        }
-        
-        .btn-secondary {
-            background: #95a5a6;
-            color: white;
-        }
-        
-        .remote-section {
-            padding: 20px;
-        }
-        
-        .power-btn {
-            width: 100%;
-            margin-bottom: 20px;
-            padding: 15px;
-            font-size: 16px;
-        }
-        
-        .control-row {
-            display: flex;
-            gap: 10px;
-            margin-bottom: 15px;
-            justify-content: center;
-        }
-        
-        .control-row button {
-            flex: 1;
-            padding: 12px;
-        }
-        
-        .nav-pad {
-            display: grid;
-            grid-template-columns: 1fr 1fr 1fr;
-            gap: 8px;
-            margin: 20px 0;
-            max-width: 200px;
-            margin-left: auto;
-            margin-right: auto;
-        }
-        
-        .nav-btn {
-            width: 60px;
-            height: 60px;
-            border-radius: 50%;
-            font-size: 20px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-        }
-        
-        .nav-btn.center {
-            background: #2ecc71;
-            font-size: 14px;
-        }
-        
-        .nav-btn:not(.center) {
-            background: #34495e;
-            color: white;
-        }
-        
-        .apps-section {
-            padding: 20px;
-            border-top: 1px solid #eee;
-        }
-        
-        .apps-grid {
-            display: grid;
-            grid-template-columns: 1fr 1fr;
-            gap: 10px;
-            margin-top: 15px;
-        }
-        
-        .app-btn {
-            padding: 15px;
-            border-radius: 12px;
-            font-size: 14px;
-        }
-        
-        .netflix { background: #e50914; color: white; }
-        .youtube { background: #ff0000; color: white; }
-        .prime { background: #00a8e1; color: white; }
-        .disney { background: #113ccf; color: white; }
-        
-        .message {
-            position: fixed;
-            top: 20px;
-            right: 20px;
-            padding: 15px 20px;
-            border-radius: 8px;
-            color: white;
-            font-weight: bold;
-            z-index: 1000;
-            transform: translateX(400px);
-            transition: transform 0.3s ease;
-        }
-        
-        .message.show {
-            transform: translateX(0);
-        }
-        
-        .message.success { background: #27ae60; }
-        .message.error { background: #e74c3c; }
-        
-        .scan-results {
-            margin-top: 15px;
-            padding: 15px;
-            background: #f8f9fa;
-            border-radius: 8px;
-            border: 1px solid #dee2e6;
-        }
-        
-        .scan-results h4 {
-            margin-bottom: 10px;
-            color: #495057;
-        }
-        
-        .tv-item {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            padding: 10px;
-            margin: 5px 0;
-            background: white;
-            border-radius: 6px;
-            border: 1px solid #dee2e6;
-        }
-        
-        .tv-info {
-            flex: 1;
-        }
-        
-        .tv-name {
-            font-weight: bold;
-            color: #495057;
-        }
-        
-        .tv-ip {
-            font-size: 12px;
-            color: #6c757d;
-        }
-        
-        .tv-connect-btn {
-            padding: 6px 12px;
-            font-size: 12px;
-            background: #28a745;
-            color: white;
-            border: none;
-            border-radius: 4px;
-            cursor: pointer;
-        }
-        
-        .tv-connect-btn:hover {
-            background: #218838;
-        }
-        
-        @media (max-width: 480px) {
-            .container {
-                margin: 0;
-                border-radius: 0;
-                min-height: 100vh;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>📺 Samsung TV Remote</h1>
-        </div>
-        
-        <div id="status" class="status disconnected">
-            Not Connected
-        </div>
-        
-        <div class="connection-panel">
-            <div class="input-group">
-                <input type="text" id="ipInput" placeholder="Enter TV IP Address (e.g., 192.168.1.100)">
-                <button id="connectBtn" class="btn-primary" onclick="connectToTV()">Connect</button>
-            </div>
-            <div class="input-group">
-                <button id="scanBtn" class="btn-warning" onclick="scanNetwork()">🔍 Auto-Detect TV</button>
-            </div>
-            <div id="scanResults" class="scan-results" style="display: none;">
-                <h4>Found Samsung TVs:</h4>
-                <div id="tvList"></div>
-            </div>
-        </div>
-        
-        <div class="remote-section">
-            <button class="power-btn btn-danger" onclick="sendKey('KEY_POWER')">⏻ POWER</button>
-            
-            <div class="control-row">
-                <button class="btn-success" onclick="sendKey('KEY_VOLUP')">VOL+</button>
-                <button class="btn-warning" onclick="sendKey('KEY_MUTE')">MUTE</button>
-                <button class="btn-success" onclick="sendKey('KEY_VOLDOWN')">VOL-</button>
-            </div>
-            
-            <div class="control-row">
-                <button class="btn-secondary" onclick="sendKey('KEY_CHUP')">CH+</button>
-                <button class="btn-secondary" onclick="sendKey('KEY_CHDOWN')">CH-</button>
-            </div>
-            
-            <div class="nav-pad">
-                <div></div>
-                <button class="nav-btn" onclick="sendKey('KEY_UP')">▲</button>
-                <div></div>
-                <button class="nav-btn" onclick="sendKey('KEY_LEFT')">◄</button>
-                <button class="nav-btn center" onclick="sendKey('KEY_ENTER')">OK</button>
-                <button class="nav-btn" onclick="sendKey('KEY_RIGHT')">►</button>
-                <div></div>
-                <button class="nav-btn" onclick="sendKey('KEY_DOWN')">▼</button>
-                <div></div>
-            </div>
-            
-            <div class="control-row">
-                <button class="btn-secondary" onclick="sendKey('KEY_HOME')">HOME</button>
-                <button class="btn-secondary" onclick="sendKey('KEY_MENU')">MENU</button>
-                <button class="btn-secondary" onclick="sendKey('KEY_RETURN')">BACK</button>
-            </div>
-            
-            <div class="control-row">
-                <button class="btn-secondary" onclick="sendKey('KEY_SOURCE')">SOURCE</button>
-                <button class="btn-secondary" onclick="sendKey('KEY_GUIDE')">GUIDE</button>
-                <button class="btn-secondary" onclick="sendKey('KEY_INFO')">INFO</button>
-            </div>
-        </div>
-        
-        <div class="apps-section">
-            <h3>Quick Apps</h3>
-            <div class="apps-grid">
-                <button class="app-btn netflix" onclick="launchApp('11101200001')">Netflix</button>
-                <button class="app-btn youtube" onclick="launchApp('111299001912')">YouTube</button>
-                <button class="app-btn prime" onclick="launchApp('3201606009684')">Prime Video</button>
-                <button class="app-btn disney" onclick="launchApp('3201901017640')">Disney+</button>
-            </div>
-        </div>
-    </div>
-    
-    <div id="message" class="message"></div>
-    
-    <script>
-        let isConnected = false;
-        
-        // Load saved IP on page load
-        window.onload = function() {
-            updateStatus();
-        };
-        
-        async function updateStatus() {
-            try {
-                const response = await fetch('/api/status');
-                const data = await response.json();
-                
-                isConnected = data.connected;
-                const statusEl = document.getElementById('status');
-                const ipInput = document.getElementById('ipInput');
-                
-                if (data.connected) {
-                    statusEl.textContent = `Connected to ${data.tv_name}`;
-                    statusEl.className = 'status connected';
-                    ipInput.value = data.tv_ip;
-                } else {
-                    statusEl.textContent = 'Not Connected';
-                    statusEl.className = 'status disconnected';
-                    if (data.tv_ip) {
-                        ipInput.value = data.tv_ip;
-                    }
-                }
-            } catch (error) {
-                console.error('Error updating status:', error);
-            }
-        }
-        
-        async function connectToTV() {
-            const ip = document.getElementById('ipInput').value.trim();
-            if (!ip) {
-                showMessage('Please enter TV IP address', 'error');
-                return;
-            }
-            
-            const connectBtn = document.getElementById('connectBtn');
-            const statusEl = document.getElementById('status');
-            
-            connectBtn.disabled = true;
-            connectBtn.textContent = 'Connecting...';
-            statusEl.textContent = 'Connecting...';
-            statusEl.className = 'status connecting';
-            
-            try {
-                const response = await fetch('/api/connect', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ ip: ip })
-                });
-                
-                const data = await response.json();
-                
-                if (data.success) {
-                    showMessage(data.message, 'success');
-                    updateStatus();
-                } else {
-                    showMessage(data.message, 'error');
-                    statusEl.textContent = 'Connection Failed';
-                    statusEl.className = 'status disconnected';
-                }
-            } catch (error) {
-                showMessage('Connection error: ' + error.message, 'error');
-                statusEl.textContent = 'Connection Failed';
-                statusEl.className = 'status disconnected';
-            }
-            
-            connectBtn.disabled = false;
-            connectBtn.textContent = 'Connect';
-        }
-        
-        async function sendKey(key) {
-            if (!isConnected) {
-                showMessage('Not connected to TV', 'error');
-                return;
-            }
-            
-            try {
-                const response = await fetch('/api/key', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ key: key })
-                });
-                
-                const data = await response.json();
-                
-                if (!data.success) {
-                    showMessage(data.message, 'error');
-                }
-            } catch (error) {
-                showMessage('Error sending key: ' + error.message, 'error');
-            }
-        }
-        
-        async function launchApp(appId) {
-            if (!isConnected) {
-                showMessage('Not connected to TV', 'error');
-                return;
-            }
-            
-            try {
-                const response = await fetch('/api/launch', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ app_id: appId })
-                });
-                
-                const data = await response.json();
-                
-                if (data.success) {
-                    showMessage('App launched', 'success');
-                } else {
-                    showMessage(data.message, 'error');
-                }
-            } catch (error) {
-                showMessage('Error launching app: ' + error.message, 'error');
-            }
-        }
-        
-        function showMessage(text, type) {
-            const messageEl = document.getElementById('message');
-            messageEl.textContent = text;
-            messageEl.className = `message ${type} show`;
-            
-            setTimeout(() => {
-                messageEl.className = `message ${type}`;
-            }, 3000);
-        }
-        
-        async function scanNetwork() {
-            const scanBtn = document.getElementById('scanBtn');
-            const scanResults = document.getElementById('scanResults');
-            const tvList = document.getElementById('tvList');
-            
-            scanBtn.disabled = true;
-            scanBtn.textContent = 'Scanning...';
-            scanResults.style.display = 'none';
-            tvList.innerHTML = '';
-            
-            showMessage('Scanning network for Samsung TVs...', 'success');
-            
-            try {
-                const response = await fetch('/api/scan');
-                const data = await response.json();
-                
-                if (data.success) {
-                    if (data.tvs && data.tvs.length > 0) {
-                        tvList.innerHTML = '';
-                        data.tvs.forEach(tv => {
-                            const tvItem = document.createElement('div');
-                            tvItem.className = 'tv-item';
-                            tvItem.innerHTML = `
-                                <div class="tv-info">
-                                    <div class="tv-name">${tv.name}</div>
-                                    <div class="tv-ip">${tv.ip}</div>
-                                </div>
-                                <button class="tv-connect-btn" onclick="connectToDetectedTV('${tv.ip}')">Connect</button>
-                            `;
-                            tvList.appendChild(tvItem);
-                        });
-                        scanResults.style.display = 'block';
-                        showMessage(`Found ${data.tvs.length} Samsung TV(s)`, 'success');
-                    } else {
-                        showMessage('No Samsung TVs found on the network', 'error');
-                    }
-                } else {
-                    showMessage('Network scan failed', 'error');
-                }
-            } catch (error) {
-                showMessage('Error scanning network: ' + error.message, 'error');
-            }
-            
-            scanBtn.disabled = false;
-            scanBtn.textContent = '🔍 Auto-Detect TV';
-        }
-        
-        function connectToDetectedTV(ip) {
-            document.getElementById('ipInput').value = ip;
-            connectToTV();
-        }
-        
-        // Add keyboard shortcuts
-        document.addEventListener('keydown', function(event) {
-            if (!isConnected) return;
-            
-            switch(event.key) {
-                case 'ArrowUp':
-                    event.preventDefault();
-                    sendKey('KEY_UP');
-                    break;
-                case 'ArrowDown':
-                    event.preventDefault();
-                    sendKey('KEY_DOWN');
-                    break;
-                case 'ArrowLeft':
-                    event.preventDefault();
-                    sendKey('KEY_LEFT');
-                    break;
-                case 'ArrowRight':
-                    event.preventDefault();
-                    sendKey('KEY_RIGHT');
-                    break;
-                case 'Enter':
-                    event.preventDefault();
-                    sendKey('KEY_ENTER');
-                    break;
-                case 'Escape':
-                    event.preventDefault();
-                    sendKey('KEY_RETURN');
-                    break;
-                case ' ':
-                    event.preventDefault();
-                    sendKey('KEY_ENTER');
-                    break;
+    def serve_static(self, path):
+        """Serve a precompressed static asset, honouring If-None-Match"""
+        asset = self.static.get(path)
+        if asset is None:
+            self.send_error(404)
+            return
+
+        encoding = asset.pick_encoding(self.headers.get("Accept-Encoding", ""))
+        etag = asset.etag(encoding)
+        if asset.matches(self.headers.get("If-None-Match", "")):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", asset.cache_control)
+            self.send_header("Vary", "Accept-Encoding")
+            self.end_headers()
+            return
+
+        body = asset.bodies[encoding]
+        self.send_response(200)
+        self.send_header("Content-type", asset.content_type)
+        self.send_header("Content-Length", str(len(body)))
+        if encoding != "identity":
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", asset.cache_control)
+        self.send_header("Vary", "Accept-Encoding")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def serve_fleet_command(self, command, data):
+        """Fan a connect, key, launch or power-on command out to a group of TVs"""
+        fleet = self.remote.fleet
+        target = data.get("target", {"all": True})
+        try:
+            if command == "key":
+                if not data.get("key"):
+                    raise ValueError("Key required")
+                success, message, results = fleet.send_key(target, data["key"])
+            elif command == "launch":
+                if not data.get("app_id"):
+                    raise ValueError("App ID required")
+                success, message, results = fleet.launch_app(target, data["app_id"])
+            elif command == "power_on":
+                success, message, results = fleet.power_on(target)
+            else:
+                success, message, results = fleet.connect(target)
+        except ValueError as e:
+            self.serve_json({"success": False, "message": str(e)})
+            return
+        self.serve_json({"success": success, "message": message, "results": results})
+
+    def stream_scan(self, refresh=False):
+        """Stream scan results as NDJSON, one line per TV plus a summary"""
+        self.send_response(200)
+        self.send_header("Content-type", "application/x-ndjson")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+
+        started = time.monotonic()
+        found_tvs = []
+        success = True
+        try:
+            for tv in self.remote.iter_scan_network(refresh=refresh):
+                found_tvs.append(tv)
+                self.write_ndjson({"type": "tv", "tv": tv})
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        except Exception as e:
+            logger.warning("Error scanning network: %s", e)
+            success = False
+
+        self.write_ndjson(
+            {
+                "type": "done",
+                "success": success,
+                "count": len(found_tvs),
+                "elapsed": round(time.monotonic() - started, 3),
             }
-        });
-    </script>
-</body>
-</html>
-        """
+        )
+
+    def stream_events(self):
+        """Push status snapshots as Server-Sent Events until the client leaves"""
+        subscriber = self.remote.status_events.subscribe()
+        if subscriber is None:
+            self.send_error(503, "Too many event streams")
+            return
+        try:
+            self.send_response(200)
+            self.send_header("Content-type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.write_event(self.remote.get_status())
+            while True:
+                try:
+                    status = subscriber.get(timeout=EVENT_STREAM_KEEPALIVE)
+                except queue.Empty:
+                    self.wfile.write(b": keepalive\n\n")
+                    self.wfile.flush()
+                    continue
+                if status is None:
+                    break
+                self.write_event(status)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            self.remote.status_events.unsubscribe(subscriber)
+
+    def query_ids(self, query):
+        """Return the integer IDs in ?id=1,2&id=3, or None if there are none"""
+        ids = parse_qs(query).get("id")
+        return [int(i) for value in ids for i in value.split(",")] if ids else None
+
+    def write_event(self, data, event="status"):
+        """Write and flush a single Server-Sent Event"""
+        self.wfile.write(f"event: {event}\ndata: {json.dumps(data)}\n\n".encode())
+        self.wfile.flush()
 
+    def write_ndjson(self, data):
+        """Write and flush a single NDJSON line"""
+        self.wfile.write(json.dumps(data).encode() + b"\n")
+        self.wfile.flush()
+
+    def serve_app_icon(self, app_id):
+        """Serve a cached app icon"""
+        tv = self.remote.tv
+        path = tv and self.remote.app_catalog.icon_path(tv.identity, app_id)
+        if not path:
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        self.send_response(200)
+        self.send_header("Content-type", "image/png")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "max-age=86400")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def serve_metrics(self):
+        """Serve metrics in the Prometheus text exposition format"""
+        body = metrics.render().encode()
         self.send_response(200)
-        self.send_header("Content-type", "text/html")
+        self.send_header("Content-type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
         self.end_headers()
-        self.wfile.write(html_content.encode())
+        self.wfile.write(body)
 
-    def serve_json(self, data):
+    def serve_json(self, data, etag=None):
         """Serve JSON response"""
+        if isinstance(data, dict) and data.get("success") is False:
+            self._failed = True
         self.send_response(200)
         self.send_header("Content-type", "application/json")
         self.send_header("Access-Control-Allow-Origin", "*")
+        if etag:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
         self.end_headers()
         self.wfile.write(json.dumps(data).encode())
 
@@ -857,6 +3410,29 @@ class RemoteHandler(BaseHTTPRequestHandler):
         pass
 
 
+class PooledHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer that handles requests on a bounded worker pool
+
+    A long /api/scan or /api/apps call only occupies one worker, so key
+    presses from other clients keep flowing while it runs.
+    """
+
+    request_queue_size = HTTP_LISTEN_BACKLOG
+
+    def __init__(self, server_address, handler_class, max_workers=HTTP_WORKERS):
+        super().__init__(server_address, handler_class)
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="http-worker"
+        )
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
 def find_free_port():
     """Find a free port to run the server"""
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -867,22 +3443,36 @@ def find_free_port():
 
 
 def main():
+    logging.basicConfig(format="%(levelname)s %(name)s: %(message)s")
     port = find_free_port()
-    server = HTTPServer(("localhost", port), RemoteHandler)
+    server = PooledHTTPServer(("localhost", port), RemoteHandler)
 
     print(f"🚀 Samsung TV Remote Server starting...")
     print(f"📱 Open your browser and go to: http://localhost:{port}")
     print(f"🔗 Or click: http://localhost:{port}")
     print(f"⏹️  Press Ctrl+C to stop the server")
 
+    # Load config and UI assets while the browser is starting, not before
+    # the socket is listening
+    threading.Thread(
+        target=lambda: (RemoteHandler.remote, RemoteHandler.static), daemon=True
+    ).start()
+
     # Auto-open browser
-    threading.Timer(1.0, lambda: webbrowser.open(f"http://localhost:{port}")).start()
+    def open_browser():
+        import webbrowser
+
+        webbrowser.open(f"http://localhost:{port}")
+
+    threading.Timer(1.0, open_browser).start()
 
     try:
         server.serve_forever()
     except KeyboardInterrupt:
         print("\n👋 Server stopped!")
+        RemoteHandler.remote.status_events.close()
         server.shutdown()
+        server.server_close()
 
 
 if __name__ == "__main__":